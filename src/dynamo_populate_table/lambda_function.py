@@ -1,76 +1,116 @@
 import json
 import boto3
 
+TABLE = "stand-prod-catalog-table"
+
+# Seed data a nivel de módulo: se construye una vez por contenedor
+ITEMS = [
+    {
+        "catalogId": "SEMAFORO#QUIZ#v1",
+        "itemId": "Q#0001",
+        "pairId": "Q#0001",
+        "questionId": "q1",
+        "orderIndex": 1,
+        "text": "🚦 ¿En qué color estás ahora mismo?",
+        "options": [
+        { "title": "🔴 Rojo", "answerId": "a" },
+        { "title": "🟡 Amarillo", "answerId": "b" },
+        { "title": "🟢 Verde", "answerId": "c" }
+        ]
+    },
+    {
+        "catalogId": "SEMAFORO#QUIZ#v1",
+        "itemId": "Q#0002",
+        "pairId": "Q#0002",
+        "questionId": "q2",
+        "orderIndex": 2,
+        "text": "🍽️ ¿Qué prefieres?",
+        "options": [
+        { "title": "🍕 Pizza", "answerId": "a" },
+        { "title": "🍣 Sushi", "answerId": "b" },
+        { "title": "🍔 Burger", "answerId": "c" }
+        ]
+    },
+    {
+        "catalogId": "SEMAFORO#QUIZ#v1",
+        "itemId": "Q#0003",
+        "pairId": "Q#0003",
+        "questionId": "q3",
+        "orderIndex": 3,
+        "text": "🌍 ¿Dónde estarías ahora mismo?",
+        "options": [
+        { "title": "🌊 Mar", "answerId": "a" },
+        { "title": "⛰️ Montaña", "answerId": "b" },
+        { "title": "🏙️ Ciudad", "answerId": "c" }
+        ]
+    },
+    {
+        "catalogId": "SEMAFORO#QUIZ#v1",
+        "itemId": "Q#0004",
+        "pairId": "Q#0004",
+        "questionId": "q4",
+        "orderIndex": 4,
+        "text": "🎉 Plan perfecto:",
+        "options": [
+        { "title": "🍻 Salir con gente", "answerId": "a" },
+        { "title": "🏠 Plan tranquilo", "answerId": "b" },
+        { "title": "✨ Improvisar", "answerId": "c" }
+        ]
+    },
+    {
+        "catalogId": "SEMAFORO#QUIZ#v1",
+        "itemId": "Q#0005",
+        "pairId": "Q#0005",
+        "questionId": "q5",
+        "orderIndex": 5,
+        "text": "🥤 ¿Qué te representa más?",
+        "options": [
+        { "title": "☕ Café", "answerId": "a" },
+        { "title": "🍺 Cerveza", "answerId": "b" },
+        { "title": "💧 Agua", "answerId": "c" }
+        ]
+    }
+]
+
+
+
+def _compiled_quiz_items(items):
+    """
+    Una fila {catalogId}#COMPILED por quiz, con las preguntas ya ordenadas por
+    orderIndex: el lambda de game la lee de una vez en lugar de query + sort.
+    """
+    by_catalog = {}
+    for it in items:
+        if "#QUIZ#" in it["catalogId"]:
+            by_catalog.setdefault(it["catalogId"], []).append(it)
+
+    compiled = []
+    for catalog_id, rows in by_catalog.items():
+        rows.sort(key=lambda x: x["orderIndex"])
+        compiled.append({
+            "catalogId": f"{catalog_id}#COMPILED",
+            "pairId": "COMPILED",  # range key de la tabla de catálogo
+            "quizTemplate": {
+                "questions": [
+                    {"questionId": r["questionId"], "text": r["text"], "options": r["options"]}
+                    for r in rows
+                ],
+            },
+        })
+    return compiled
+
+
+COMPILED_ITEMS = _compiled_quiz_items(ITEMS)
+
+
 def lambda_handler(event, context):
-    TABLE = "stand-prod-catalog-table"
     dynamodb = boto3.resource("dynamodb")
     t = dynamodb.Table(TABLE)
 
-    items = [
-        {
-            "catalogId": "SEMAFORO#QUIZ#v1",
-            "itemId": "Q#0001",
-            "questionId": "q1",
-            "orderIndex": 1,
-            "text": "🚦 ¿En qué color estás ahora mismo?",
-            "options": [
-            { "title": "🔴 Rojo", "answerId": "a" },
-            { "title": "🟡 Amarillo", "answerId": "b" },
-            { "title": "🟢 Verde", "answerId": "c" }
-            ]
-        },
-        {
-            "catalogId": "SEMAFORO#QUIZ#v1",
-            "itemId": "Q#0002",
-            "questionId": "q2",
-            "orderIndex": 2,
-            "text": "🍽️ ¿Qué prefieres?",
-            "options": [
-            { "title": "🍕 Pizza", "answerId": "a" },
-            { "title": "🍣 Sushi", "answerId": "b" },
-            { "title": "🍔 Burger", "answerId": "c" }
-            ]
-        },
-        {
-            "catalogId": "SEMAFORO#QUIZ#v1",
-            "itemId": "Q#0003",
-            "questionId": "q3",
-            "orderIndex": 3,
-            "text": "🌍 ¿Dónde estarías ahora mismo?",
-            "options": [
-            { "title": "🌊 Mar", "answerId": "a" },
-            { "title": "⛰️ Montaña", "answerId": "b" },
-            { "title": "🏙️ Ciudad", "answerId": "c" }
-            ]
-        },
-        {
-            "catalogId": "SEMAFORO#QUIZ#v1",
-            "itemId": "Q#0004",
-            "questionId": "q4",
-            "orderIndex": 4,
-            "text": "🎉 Plan perfecto:",
-            "options": [
-            { "title": "🍻 Salir con gente", "answerId": "a" },
-            { "title": "🏠 Plan tranquilo", "answerId": "b" },
-            { "title": "✨ Improvisar", "answerId": "c" }
-            ]
-        },
-        {
-            "catalogId": "SEMAFORO#QUIZ#v1",
-            "itemId": "Q#0005",
-            "questionId": "q5",
-            "orderIndex": 5,
-            "text": "🥤 ¿Qué te representa más?",
-            "options": [
-            { "title": "☕ Café", "answerId": "a" },
-            { "title": "🍺 Cerveza", "answerId": "b" },
-            { "title": "💧 Agua", "answerId": "c" }
-            ]
-        }
-        ]
-
-    with t.batch_writer() as batch:
-        for it in items:
+    # overwrite_by_pkeys (clave de la tabla: catalogId + pairId): si el seed
+    # repite clave, boto3 la deduplica en el buffer
+    with t.batch_writer(overwrite_by_pkeys=["catalogId", "pairId"]) as batch:
+        for it in ITEMS + COMPILED_ITEMS:
             batch.put_item(Item=it)
 
-    print("OK")
\ No newline at end of file
+    print("OK")
@@ -1,6 +1,8 @@
 # handler: billing_checkout.lambda_handler
 import os
 import json
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timezone
 from typing import Optional
 
@@ -13,47 +15,64 @@ dynamodb = boto3.resource("dynamodb")
 
 # ========= ENV =========
 USERS_TABLE = (os.environ.get("USERS_TABLE", "") or "").strip()
+users_table = dynamodb.Table(USERS_TABLE) if USERS_TABLE else None
+
+# Escritura "de debug" (lastCheckoutSessionId): se espera con un tope para que
+# un DynamoDB lento no retrase la respuesta, pero sin dejarla a medias al
+# congelarse el contenedor
+_bg = ThreadPoolExecutor(max_workers=1)
+_BG_WAIT_S = 2.0
 
 # URLs a las que vuelve Stripe tras pagar/cancelar (solo env, no están en el secret)
 STRIPE_SUCCESS_URL = (os.environ.get("STRIPE_SUCCESS_URL", "") or "").strip()
 STRIPE_CANCEL_URL = (os.environ.get("STRIPE_CANCEL_URL", "") or "").strip()
 
 # Stripe keys solo desde Secrets Manager (STRIPE_SECRET_NAME obligatorio)
-STRIPE_SECRET_KEY = ""
-STRIPE_PRICE_ID = ""
 _stripe_secret_name = os.environ.get("STRIPE_SECRET_NAME", "").strip()
-if _stripe_secret_name:
-    try:
-        sm = boto3.client("secretsmanager")
-        raw = sm.get_secret_value(SecretId=_stripe_secret_name)
-        data = json.loads(raw.get("SecretString", "{}"))
-        if data:
-            STRIPE_SECRET_KEY = (data.get("STRIPE_SECRET_KEY") or data.get("SECRET_KEY") or "").strip()
-            STRIPE_PRICE_ID = (data.get("STRIPE_PRICE_ID") or data.get("PRICE_ID") or "").strip()
-    except Exception as e:
-        print(json.dumps({"msg": "stripe_secret_load_failed", "error": repr(e)}))
 
-stripe.api_key = STRIPE_SECRET_KEY
+
+@functools.lru_cache(maxsize=1)
+def _stripe_config() -> tuple[str, str]:
+    """
+    Carga (secret_key, price_id) del secret la primera vez que hace falta y lo
+    reutiliza en invocaciones warm. OPTIONS/405 nunca llegan a llamar aquí.
+    Si Secrets Manager falla, la excepción no se cachea y se reintenta.
+    """
+    if not _stripe_secret_name:
+        return "", ""
+
+    sm = boto3.client("secretsmanager")
+    raw = sm.get_secret_value(SecretId=_stripe_secret_name)
+    data = json.loads(raw.get("SecretString", "{}")) or {}
+    secret_key = (data.get("STRIPE_SECRET_KEY") or data.get("SECRET_KEY") or "").strip()
+    price_id = (data.get("STRIPE_PRICE_ID") or data.get("PRICE_ID") or "").strip()
+
+    stripe.api_key = secret_key
+    return secret_key, price_id
+
+
+# Encoder único: json.dumps con kwargs construye un JSONEncoder nuevo en cada llamada
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
 
 
 def log(msg, data=None):
-    print(json.dumps({"msg": msg, "data": data}, ensure_ascii=False))
+    print(_json_encode({"msg": msg, "data": data}))
 
 
 def _resp(status: int, body: dict):
     return {
         "statusCode": int(status),
         "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(body, ensure_ascii=False),
+        "body": _json_encode(body),
     }
 
 
 def _iso_now() -> str:
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()[:-6] + "Z"
 
 
 def _parse_iso(s: str) -> datetime:
-    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return datetime.fromisoformat(s)
 
 
 def _is_expired(active_until: Optional[str]) -> bool:
@@ -66,9 +85,12 @@ def _is_expired(active_until: Optional[str]) -> bool:
 
 
 def _get_http_method(event: dict) -> str:
-    method = event.get("requestContext", {}).get("http", {}).get("method")
-    if method:
-        return method.upper()
+    # HTTP API (payload v2) primero: es lo que nos llega vía GameApi
+    http = (event.get("requestContext") or {}).get("http")
+    if http:
+        method = http.get("method")
+        if method:
+            return method.upper()
     return (event.get("httpMethod") or "").upper()
 
 
@@ -79,6 +101,12 @@ def _get_claims(event: dict) -> dict:
     return jwt.get("claims") or auth.get("claims") or {}
 
 
+def _log_bg_error(fut):
+    e = fut.exception()
+    if e is not None:
+        log("checkout:bg_update_failed", repr(e))
+
+
 def _normalize_user(item: dict) -> dict:
     user = dict(item or {})
     user.setdefault("plan", "FREE")
@@ -113,10 +141,16 @@ def _get_or_create_user(table, user_id: str, email: Optional[str]) -> dict:
 
 
 def handle_checkout(event: dict):
+    try:
+        stripe_secret_key, stripe_price_id = _stripe_config()
+    except Exception as e:
+        log("stripe_secret_load_failed", repr(e))
+        stripe_secret_key, stripe_price_id = "", ""
+
     missing = [k for k, v in {
         "USERS_TABLE": USERS_TABLE,
-        "STRIPE_SECRET_KEY": STRIPE_SECRET_KEY,
-        "STRIPE_PRICE_ID": STRIPE_PRICE_ID,
+        "STRIPE_SECRET_KEY": stripe_secret_key,
+        "STRIPE_PRICE_ID": stripe_price_id,
         "STRIPE_SUCCESS_URL": STRIPE_SUCCESS_URL,
         "STRIPE_CANCEL_URL": STRIPE_CANCEL_URL,
     }.items() if not v]
@@ -132,7 +166,7 @@ def handle_checkout(event: dict):
     if not user_id:
         return _resp(401, {"error": "Missing sub claim (unauthorized)"})
 
-    table = dynamodb.Table(USERS_TABLE)
+    table = users_table
 
     # Asegura que el user existe (bootstrap silent)
     user = _get_or_create_user(table, user_id, email)
@@ -154,7 +188,7 @@ def handle_checkout(event: dict):
 
         session = stripe.checkout.Session.create(
             mode="payment",
-            line_items=[{"price": STRIPE_PRICE_ID, "quantity": 1}],
+            line_items=[{"price": stripe_price_id, "quantity": 1}],
             success_url=STRIPE_SUCCESS_URL,
             cancel_url=STRIPE_CANCEL_URL,
             client_reference_id=user_id,
@@ -162,13 +196,23 @@ def handle_checkout(event: dict):
             metadata={"userId": user_id},
         )
 
-        # Guardamos sessionId (debug)
-        table.update_item(
+        # Guardamos sessionId (debug): el checkoutUrl no depende de esta escritura,
+        # así que un fallo o un timeout solo se loguea y se responde igual.
+        fut = _bg.submit(
+            table.update_item,
             Key={"userId": user_id},
             UpdateExpression="SET #updatedAt=:now, #lastCheckoutSessionId=:sid",
             ExpressionAttributeNames={"#updatedAt": "updatedAt", "#lastCheckoutSessionId": "lastCheckoutSessionId"},
             ExpressionAttributeValues={":now": now, ":sid": session.get("id")},
         )
+        try:
+            fut.result(timeout=_BG_WAIT_S)
+        except FutureTimeout:
+            log("checkout:bg_update_timeout", {"userId": user_id, "waitS": _BG_WAIT_S})
+            # si acaba fallando mientras el contenedor sigue vivo, que se vea
+            fut.add_done_callback(_log_bg_error)
+        except Exception as e:
+            log("checkout:bg_update_failed", repr(e))
 
         return _resp(200, {
             "ok": True,
@@ -3,13 +3,17 @@ Handles OPTIONS preflight for GameApi. No auth so browser preflight succeeds.
 Returns 200 with explicit CORS headers so the preflight always has HTTP OK status.
 """
 
+# Static response: built once per container and never mutated
+_CORS_RESPONSE = {
+    "statusCode": 200,
+    "headers": {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+        "Access-Control-Allow-Headers": "authorization, content-type",
+    },
+    "body": "",
+}
+
+
 def lambda_handler(event, context):
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "authorization, content-type",
-        },
-        "body": "",
-    }
+    return _CORS_RESPONSE
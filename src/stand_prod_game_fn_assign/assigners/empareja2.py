@@ -1,5 +1,9 @@
 import os
+import math
+import time
 import random
+import functools
+from collections import namedtuple
 from decimal import Decimal
 
 import boto3
@@ -14,17 +18,36 @@ CHAR_BUCKET = os.environ.get("CHAR_BUCKET", "")
 CHAR_REGION = os.environ.get("CHAR_REGION", "us-east-1")
 CHAR_URL_EXPIRES = int(os.environ.get("CHAR_URL_EXPIRES", "120"))
 
+# Catálogo ya "digerido" para el warm path:
+#   items:      tuple de (characterId:int|None, characterName, pairId)
+#   pair_index: pairId -> tuple de (characterId, characterName)
+CatalogCache = namedtuple("CatalogCache", "items pair_index")
+
 _CATALOG_CACHE = {}
+_TABLE_CACHE = {}
 _s3 = boto3.client("s3", region_name=CHAR_REGION)
+_randrange = random.randrange
 
 
 def _as_int(x):
-    if isinstance(x, Decimal):
-        return int(x)
-    try:
-        return int(x)
-    except Exception:
-        return None
+    # dispatch explícito: sin try/except en el camino normal (Decimal del catálogo)
+    if isinstance(x, int):
+        return x
+    if isinstance(x, (Decimal, float)):
+        return int(x) if math.isfinite(x) else None
+    if isinstance(x, str):
+        s = x.strip()
+        digits = s[1:] if s[:1] in ("+", "-") else s
+        return int(s) if digits.isdecimal() else None
+    return None
+
+
+def _catalog_table(dynamo_r):
+    # Table() is cheap but not free; reuse it across warm invocations
+    table = _TABLE_CACHE.get(CATALOG_TABLE)
+    if table is None:
+        table = _TABLE_CACHE[CATALOG_TABLE] = dynamo_r.Table(CATALOG_TABLE)
+    return table
 
 
 def _query_empareja2_catalog(dynamo_r):
@@ -32,7 +55,7 @@ def _query_empareja2_catalog(dynamo_r):
     if cached is not None:
         return cached
 
-    catalog = dynamo_r.Table(CATALOG_TABLE)
+    catalog = _catalog_table(dynamo_r)
     items = []
 
     kwargs = {
@@ -51,38 +74,58 @@ def _query_empareja2_catalog(dynamo_r):
     if not items:
         raise RuntimeError(f"No items found in catalog: {EMPAREJA2_CATALOG_ID}")
 
-    _CATALOG_CACHE[EMPAREJA2_CATALOG_ID] = items
-    return items
+    # Convertimos una sola vez (Decimal -> int, pairId -> str) al poblar la caché
+    rows = []
+    pair_index = {}
+    for it in items:
+        cid = _as_int(it.get("characterId"))
+        cname = it.get("characterName")
+        pair_id = str(it.get("pairId") or "")
+        rows.append((cid, cname or "Personaje", pair_id))
+        pair_index.setdefault(pair_id, []).append((cid, cname))
+
+    cache = CatalogCache(
+        items=tuple(rows),
+        pair_index={k: tuple(v) for k, v in pair_index.items()},
+    )
+    _CATALOG_CACHE[EMPAREJA2_CATALOG_ID] = cache
+    return cache
 
 
-def _pick_random_character(items):
-    choice = random.choice(items)
-    cid = _as_int(choice.get("characterId"))
+def _pick_random_character(catalog: CatalogCache):
+    items = catalog.items
+    cid, cname, pair_id = items[_randrange(len(items))]
     if cid is None:
         raise RuntimeError("characterId must be numeric in catalog")
-    cname = choice.get("characterName") or "Personaje"
-    pair_id = str(choice.get("pairId") or "")
     return cid, cname, pair_id
 
 
-def _partner_name(items, pair_id: str, assigned_cid: int) -> str:
-    for it in items:
-        if str(it.get("pairId") or "") == pair_id and _as_int(it.get("characterId")) != assigned_cid:
-            return it.get("characterName") or "tu pareja"
+def _partner_name(catalog: CatalogCache, pair_id: str, assigned_cid: int) -> str:
+    for cid, cname in catalog.pair_index.get(pair_id) or ():
+        if cid != assigned_cid:
+            return cname or "tu pareja"
     return "tu pareja"
 
 
+@functools.lru_cache(maxsize=256)
+def _presign_character(character_name: str, bucket_slot: int) -> str:
+    # bucket_slot solo forma parte de la clave de caché (rota la URL)
+    return _s3.generate_presigned_url(
+        ClientMethod="get_object",
+        Params={"Bucket": CHAR_BUCKET, "Key": f"{character_name}.png"},
+        ExpiresIn=CHAR_URL_EXPIRES,
+    )
+
+
 def _character_image_url(character_name: str) -> str | None:
     if not CHAR_BUCKET:
         return None
 
-    key = f"{character_name}.png"
+    # Reutilizamos la URL firmada durante media caducidad: quien la recibe
+    # siempre tiene al menos CHAR_URL_EXPIRES/2 segundos para abrirla.
+    slot = int(time.time() // max(1, CHAR_URL_EXPIRES // 2))
     try:
-        return _s3.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={"Bucket": CHAR_BUCKET, "Key": key},
-            ExpiresIn=CHAR_URL_EXPIRES,
-        )
+        return _presign_character(character_name, slot)
     except Exception:
         return None
 
@@ -99,9 +142,9 @@ def assign_empareja2(ctx: dict):
     username_at = ctx["username_at"]
     dynamo_r = ctx["dynamo_r"]
 
-    catalog_items = _query_empareja2_catalog(dynamo_r)
-    cid, cname, pair_id = _pick_random_character(catalog_items)
-    partner = _partner_name(catalog_items, pair_id, cid)
+    catalog = _query_empareja2_catalog(dynamo_r)
+    cid, cname, pair_id = _pick_random_character(catalog)
+    partner = _partner_name(catalog, pair_id, cid)
 
     patch = {
         "type": {
@@ -2,14 +2,16 @@ def assign_generic(ctx: dict):
     """
     Default assigner for any future gameType.
     Only customizes messaging.
+
+    Same contract as the other assigners:
+      returns (patch, welcome_header, extra_messages[, extra_items])
+
+    extra_items (optional): additional gameplayer rows to write after the
+    player item (batched by assign.py).
     """
-    psid = ctx["psid"]
-    username_at = ctx["username_at"]
     player_id = ctx["playerId"]
 
-    messages = [{
-        "psid": psid,
-        "text": f"¡Te has unido al juego! ✅\nTu número de jugador es: {player_id}"
-    }]
+    welcome_header = f"¡Te has unido al juego! ✅\nTu número de jugador es: {player_id}"
+    extra_messages = []  # none
 
-    return ({}, messages)
+    return ({}, welcome_header, extra_messages)
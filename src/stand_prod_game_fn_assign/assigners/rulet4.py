@@ -1,18 +1,21 @@
-def assign_rulet4(ctx: dict):
-    username_at = ctx["username_at"]
-
-    patch = {
-        "type": {
-            "RULET4": {
-                "lastSpin": None,
-                "spinUsed": False,
-                "quizAnswers": {},
-            }
+# Patch constante, construido una sola vez. Solo se usa para el put_item del
+# jugador: NO mutar.
+_RULET4_PATCH = {
+    "type": {
+        "RULET4": {
+            "lastSpin": None,
+            "spinUsed": False,
+            "quizAnswers": {},
         }
     }
+}
+
+
+def assign_rulet4(ctx: dict):
+    username_at = ctx["username_at"]
 
     welcome_header = f"🎡 ¡Bienvenid@ a Rulet4, {username_at}!\n\n"
     extra_messages = []  # none
 
-    return (patch, welcome_header, extra_messages)
+    return (_RULET4_PATCH, welcome_header, extra_messages)
 
@@ -1,3 +1,19 @@
+# Patch constante, construido una sola vez. Solo se usa para el put_item del
+# jugador: NO mutar.
+_SEMAFORO_PATCH = {
+    "type": {
+        "SEMAFORO": {
+            "onboarding": {
+                "stepIndex": 0,      # 0 = color, 1..5 = preguntas
+                "completed": False,
+            },
+            "color": None,          # ROJO | AMARILLO | VERDE
+            "quizAnswers": {},
+        }
+    }
+}
+
+
 def assign_semaforo(ctx: dict):
     """
     SEMÁFORO assignment (nuevo flujo común):
@@ -8,20 +24,7 @@ def assign_semaforo(ctx: dict):
     psid = ctx["psid"]
     username_at = ctx["username_at"]
 
-    patch = {
-        "type": {
-            "SEMAFORO": {
-                "onboarding": {
-                    "stepIndex": 0,      # 0 = color, 1..5 = preguntas
-                    "completed": False,
-                },
-                "color": None,          # ROJO | AMARILLO | VERDE
-                "quizAnswers": {},
-            }
-        }
-    }
-
     welcome_header = f"🚦 ¡Bienvenid@ a SEMÁFORO, {username_at}!\n\n"
     extra_messages = []  # none
 
-    return (patch, welcome_header, extra_messages)
+    return (_SEMAFORO_PATCH, welcome_header, extra_messages)
@@ -1,16 +1,19 @@
-def assign_t1mer(ctx: dict):
-    username_at = ctx["username_at"]
-
-    patch = {
-        "type": {
-            "T1MER": {
-                "score": 0,
-                "quizAnswers": {},
-            }
+# Patch constante, construido una sola vez. Solo se usa para el put_item del
+# jugador: NO mutar.
+_T1MER_PATCH = {
+    "type": {
+        "T1MER": {
+            "score": 0,
+            "quizAnswers": {},
         }
     }
+}
+
+
+def assign_t1mer(ctx: dict):
+    username_at = ctx["username_at"]
 
     welcome_header = f"⏱️ ¡Bienvenid@ a T1mer, {username_at}!\n\n"
     extra_messages = []  # none
 
-    return (patch, welcome_header, extra_messages)
\ No newline at end of file
+    return (_T1MER_PATCH, welcome_header, extra_messages)
\ No newline at end of file
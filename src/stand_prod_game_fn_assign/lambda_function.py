@@ -1,39 +1,134 @@
 import os
 import json
-import random
+import importlib
+import secrets
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from decimal import Decimal
 
 import boto3
+import botocore.session
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
+from botocore.loaders import Loader
+from boto3.dynamodb.conditions import Attr, Key
 
 # ========= ENV VARS =========
 GAMES_TABLE = os.environ.get("GAMES_TABLE", "stand-prod-game-table")
 GAMEPLAYER_TABLE = os.environ.get("GAMEPLAYER_TABLE", "stand-prod-gameplayer-table")
 IG_SENDER_LAMBDA = os.environ.get("IG_SENDER_LAMBDA", "instagram-sender")
+# Si está definida, los DMs van por la cola del sender (SQS) en vez de invoke directo
+IG_SENDER_QUEUE_URL = os.environ.get("IG_SENDER_QUEUE_URL", "")
 QUIZ_LAMBDA = os.environ.get("QUIZ_LAMBDA", "stand-prod-game-fn-quiz")
 
 
 # Optional GSI
 GSI_INSTAGRAM_PSID = os.environ.get("GSI_INSTAGRAM_PSID", "gsi-instagramPSID")
 
+# Condition builders (nombres constantes; .eq() devuelve un objeto nuevo)
+_KEY_GAMEID = Key("gameId")
+_KEY_PSID = Key("instagramPSID")
+_ATTR_PSID = Attr("instagramPSID")
+
 # ========= AWS =========
-dynamo_r = boto3.resource("dynamodb")
-lambda_client = boto3.client("lambda")
+class _FastDynamoLoader(Loader):
+    """
+    Marca AttributeValue como "document" en el modelo de DynamoDB: el parser de
+    botocore devuelve cada atributo tal cual llega del JSON (sin recorrer su
+    estructura) y el TypeDeserializer de boto3 lo sigue convirtiendo igual.
+    Ojo: no vale para atributos binarios (B/BS), que aquí no se usan.
+    """
+
+    def load_service_model(self, service_name, type_name, api_version=None):
+        model = super().load_service_model(service_name, type_name, api_version)
+        if service_name == "dynamodb" and type_name == "service-2":
+            model["shapes"]["AttributeValue"]["document"] = True
+        return model
+
+
+def _fast_dynamodb_session():
+    session = botocore.session.get_session()
+    session.register_component("data_loader", _FastDynamoLoader())
+    return boto3.Session(botocore_session=session)
+
+
+# Keep-alive + pool para reutilizar conexiones en invocaciones warm.
+# DynamoDB con timeouts cortos; Lambda sin read_timeout propio porque el
+# invoke síncrono del quiz puede tardar más de unos segundos.
+_DDB_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    retries={"max_attempts": 3, "mode": "standard"},
+    connect_timeout=1,
+    read_timeout=3,
+)
+_LAMBDA_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    retries={"max_attempts": 3, "mode": "standard"},
+    connect_timeout=1,
+)
+
+dynamo_r = _fast_dynamodb_session().resource("dynamodb", config=_DDB_CFG)
+lambda_client = boto3.client("lambda", config=_LAMBDA_CFG)
+sqs_client = boto3.client("sqs", config=_LAMBDA_CFG) if IG_SENDER_QUEUE_URL else None
 
 games_table = dynamo_r.Table(GAMES_TABLE)
 gp_table = dynamo_r.Table(GAMEPLAYER_TABLE)
+# Cliente low-level propio para el hot path: dynamo_r.meta.client no sirve,
+# el resource le registra su (de)serialización automática
+dynamo_c = _fast_dynamodb_session().client("dynamodb", config=_DDB_CFG)
+
+# Pool warm para lanzar lecturas independientes de DynamoDB en paralelo
+_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def _prewarm_connections():
+    """
+    Cold start: abre las conexiones TLS durante el init (fuera del handler) con
+    llamadas baratas para las que el rol ya tiene permiso. El Lambda client no
+    se calienta: no hay ninguna llamada barata permitida (solo InvokeFunction).
+    """
+    calls = [
+        lambda: games_table.get_item(Key={"gameId": "__warmup__"}, ProjectionExpression="gameId"),
+        lambda: dynamo_c.get_item(TableName=GAMES_TABLE, Key={"gameId": {"S": "__warmup__"}}, ProjectionExpression="gameId"),
+    ]
+    if sqs_client:
+        calls.append(lambda: sqs_client.get_queue_attributes(QueueUrl=IG_SENDER_QUEUE_URL, AttributeNames=["QueueArn"]))
+    for fut in [_pool.submit(c) for c in calls]:
+        try:
+            fut.result(timeout=2)
+        except Exception:
+            pass
+
+
+if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    _prewarm_connections()
 
 # ========= Helpers =========
 
+# LOG_LEVEL=DEBUG activa los logs de diagnóstico del happy path (errores siempre)
+DEBUG = os.environ.get("LOG_LEVEL", "INFO").upper() == "DEBUG"
+
 def log(msg, obj=None):
     if obj is not None:
-        print(json.dumps({"msg": msg, "data": obj}, ensure_ascii=False))
+        print(json.dumps({"msg": msg, "data": obj}, ensure_ascii=False, default=_json_default))
     else:
         print(json.dumps({"msg": msg}, ensure_ascii=False))
 
+def _json_default(o):
+    if isinstance(o, Decimal):
+        return int(o) if o % 1 == 0 else float(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+# Encoder único para los payloads de invoke (json.dumps con kwargs crea uno por llamada)
+_payload_encoder = json.JSONEncoder(ensure_ascii=False, default=_json_default)
+
+def _payload_bytes(obj) -> bytes:
+    return _payload_encoder.encode(obj).encode("utf-8")
+
 def _json_sanitize(obj):
     """Convert Dynamo Decimals to int/float recursively (safe for logging/returns)."""
     if isinstance(obj, Decimal):
@@ -45,66 +140,185 @@ def _json_sanitize(obj):
     return obj
 
 def _iso_now() -> str:
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    return datetime.now(timezone.utc).isoformat()[:-6] + "Z"
 
 def _code4() -> int:
-    return random.randint(1000, 9999)
+    # el código es lo que valida al jugador en pantalla: que no sea predecible
+    return 1000 + secrets.randbelow(9000)
 
-def _send_bulk_messages(messages):
+_ig_encode = _payload_encoder.encode  # encoder del bloque compartido de abajo
+
+
+# >>> IG sender FIFO: copia idéntica en stand_prod_game_fn_assign y
+# stand_prod_game_fn_quiz (cada Lambda se despliega por separado, sin código
+# compartido). Cualquier cambio aquí, en las dos copias a la vez.
+
+# Async invoke y SQS cortan en 256 KB: dejamos margen para el envoltorio
+_MAX_PAYLOAD_BYTES = 240_000
+_SQS_BATCH_MAX = 10  # límite de SendMessageBatch
+
+
+def _split_payloads(messages) -> list:
+    # [(messages, body)]: si no cabe en un envío se parte en mitades (en orden)
+    body = _ig_encode({"messages": messages}).encode("utf-8")
+    if len(body) > _MAX_PAYLOAD_BYTES and len(messages) > 1:
+        mid = len(messages) // 2
+        return _split_payloads(messages[:mid]) + _split_payloads(messages[mid:])
+    return [(messages, body)]
+
+
+def _send_sqs_batch(entries):
+    try:
+        resp = sqs_client.send_message_batch(QueueUrl=IG_SENDER_QUEUE_URL, Entries=entries)
+        failed = resp.get("Failed") or []
+        if failed:
+            log("igsender_sqs_batch_failed", {"failed": len(failed), "codes": [f.get("Code") for f in failed]})
+    except Exception as e:
+        log("igsender_send_error", {"error": repr(e), "count": len(entries)})
+
+
+def _send_to_ig_sender(messages):
     """
-    messages: [{ "psid": "...", "text": "..." }, { "psid": "...", "image_url": "..." }, ...]
+    Envía {"messages": [...]} a la cola FIFO del IG sender (o invoke Event si no
+    hay cola). En la cola cada psid va con su MessageGroupId: SQS solo garantiza
+    el orden dentro de un grupo, así que los mensajes se agrupan por psid.
     """
     if not messages:
         return
 
-    payload = {"messages": messages}
-    try:
-        lambda_client.invoke(
-            FunctionName=IG_SENDER_LAMBDA,
-            InvocationType="Event",
-            Payload=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-        )
-    except Exception as e:
-        log("assign_send_bulk_error", {"error": repr(e), "count": len(messages)})
+    if not sqs_client:
+        for chunk, body in _split_payloads(messages):
+            try:
+                lambda_client.invoke(
+                    FunctionName=IG_SENDER_LAMBDA,
+                    InvocationType="Event",
+                    Payload=body,
+                )
+            except Exception as e:
+                log("igsender_send_error", {"error": repr(e), "count": len(chunk)})
+        return
+
+    groups: dict[str, list] = {}
+    for m in messages:
+        groups.setdefault(str(m.get("psid") or "-"), []).append(m)
+
+    batch, size = [], 0
+    for psid, group in groups.items():
+        for _, body in _split_payloads(group):
+            if batch and (len(batch) == _SQS_BATCH_MAX or size + len(body) > _MAX_PAYLOAD_BYTES):
+                _send_sqs_batch(batch)
+                batch, size = [], 0
+            batch.append({
+                "Id": str(len(batch)),
+                "MessageBody": body.decode("utf-8"),
+                "MessageGroupId": psid,
+                "MessageDeduplicationId": uuid.uuid4().hex,
+            })
+            size += len(body)
+    if batch:
+        _send_sqs_batch(batch)
+# <<< IG sender FIFO
+
+
+def _send_bulk_messages(messages):
+    """
+    messages: [{ "psid": "...", "text": "..." }, { "psid": "...", "image_url": "..." }, ...]
+    """
+    _send_to_ig_sender(messages)
 
 def _send_single_dm(psid: str, text: str):
     if not psid:
         return
     _send_bulk_messages([{"psid": psid, "text": text}])
 
-def _get_game_meta(game_id: str) -> dict | None:
-    resp = games_table.get_item(Key={"gameId": game_id})
-    return resp.get("Item")
+# Cache warm de metadatos del game (cambian poco: isActive, gameType, maxPlayers...)
+_META_CACHE: dict[str, tuple[float, dict]] = {}
+_META_TTL_S = 30.0
+# Solo lo que usa el assign (quizQuestions & co pueden ser grandes). gameId va
+# siempre para que un game sin estos campos no llegue como Item vacío.
+_META_PROJECTION = "gameId, isActive, gameType, maxPlayers, quizOrder, playerIdSeq"
 
-def _ensure_game_counters(game_id: str):
+def _from_av(av: dict):
     """
-    Inicializa counters si no existen. Idempotente (compat con games antiguos).
+    AttributeValue (formato low-level) -> Python, igual que el TypeDeserializer
+    de boto3 para los tipos que hay en el item del game (N -> Decimal).
     """
-    games_table.update_item(
-        Key={"gameId": game_id},
-        UpdateExpression=(
-            "SET playersCount = if_not_exists(playersCount, :z), "
-            "validatedCount = if_not_exists(validatedCount, :z)"
-        ),
-        ExpressionAttributeValues={":z": 0},
+    (t, v), = av.items()
+    if t == "S" or t == "BOOL":
+        return v
+    if t == "N":
+        return Decimal(v)
+    if t == "NULL":
+        return None
+    if t == "L":
+        return [_from_av(x) for x in v]
+    if t == "M":
+        return {k: _from_av(x) for k, x in v.items()}
+    return v
+
+def _get_game_meta(game_id: str, use_cache: bool = True) -> dict | None:
+    """
+    Devuelve el item del game (compartido con la caché: NO mutar).
+    use_cache=False fuerza la lectura y refresca la caché.
+    """
+    if use_cache:
+        hit = _META_CACHE.get(game_id)
+        if hit and time.monotonic() - hit[0] < _META_TTL_S:
+            return hit[1]
+
+    resp = dynamo_c.get_item(
+        TableName=GAMES_TABLE,
+        Key={"gameId": {"S": game_id}},
+        ProjectionExpression=_META_PROJECTION,
     )
+    raw = resp.get("Item")
+    item = {k: _from_av(v) for k, v in raw.items()} if raw else None
+    if item:
+        _META_CACHE[game_id] = (time.monotonic(), item)
+    else:
+        _META_CACHE.pop(game_id, None)
+    return item
+
+def _max_players(meta: dict) -> int:
+    return int(meta.get("maxPlayers") or 9999)
 
-def _reserve_player_slot(game_id: str, max_players: int, now_iso: str) -> bool:
+def _reserve_player_slot(game_id: str, now_iso: str, seq_base: int = 0) -> int | None:
     """
-    Incrementa playersCount de forma atómica SOLO si no excede maxPlayers.
-    Devuelve True si reserva OK, False si límite alcanzado.
+    Reserva plaza en un único update condicional contra el propio item del game:
+    el game existe, está activo y playersCount < maxPlayers (los valores actuales,
+    no los del meta cacheado). En el mismo update asigna el siguiente playerId
+    desde playerIdSeq; seq_base solo se usa si el game aún no tiene playerIdSeq
+    (games antiguos).
+    Devuelve el nuevo playerId, o None si la condición falla (no existe,
+    inactivo o lleno: el caller lo distingue releyendo el game).
     """
     try:
-        games_table.update_item(
-            Key={"gameId": game_id},
-            UpdateExpression="ADD playersCount :one SET lastJoinAt = :now, updatedAt = :now",
-            ConditionExpression="attribute_not_exists(playersCount) OR playersCount < :max",
-            ExpressionAttributeValues={":one": 1, ":now": now_iso, ":max": int(max_players)},
+        resp = dynamo_c.update_item(
+            TableName=GAMES_TABLE,
+            Key={"gameId": {"S": game_id}},
+            UpdateExpression=(
+                "ADD playersCount :one "
+                "SET playerIdSeq = if_not_exists(playerIdSeq, :base) + :one, "
+                "lastJoinAt = :now, updatedAt = :now"
+            ),
+            ConditionExpression=(
+                "attribute_exists(gameId) "
+                "AND (attribute_not_exists(isActive) OR isActive = :true) "
+                "AND (attribute_not_exists(playersCount) OR attribute_not_exists(maxPlayers) "
+                "OR playersCount < maxPlayers)"
+            ),
+            ExpressionAttributeValues={
+                ":one": {"N": "1"},
+                ":base": {"N": str(int(seq_base))},
+                ":now": {"S": now_iso},
+                ":true": {"BOOL": True},
+            },
+            ReturnValues="UPDATED_NEW",
         )
-        return True
+        return int(resp["Attributes"]["playerIdSeq"]["N"])
     except ClientError as e:
         if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
-            return False
+            return None
         raise
 
 def _rollback_player_slot(game_id: str, now_iso: str):
@@ -120,50 +334,68 @@ def _rollback_player_slot(game_id: str, now_iso: str):
 
 def _get_last_player_id(game_id: str) -> int:
     """
-    Query descending by SK to get the last assigned playerId.
+    Query descending by SK to get the last assigned playerId (only used to
+    seed playerIdSeq on games created before it existed).
     Returns 0 if none.
     """
     resp = gp_table.query(
-        KeyConditionExpression=Key("gameId").eq(game_id),
+        KeyConditionExpression=_KEY_GAMEID.eq(game_id),
         ProjectionExpression="playerId",
+        Select="SPECIFIC_ATTRIBUTES",
         ScanIndexForward=False,
         Limit=1,
+        # siembra playerIdSeq una sola vez por game antiguo: una lectura
+        # eventual podría no ver el último player y repetir su playerId
+        ConsistentRead=True,
     )
     items = resp.get("Items") or []
     if not items:
         return 0
-    pid = items[0].get("playerId")
-    return int(pid) if not isinstance(pid, Decimal) else int(pid)
+    return int(items[0].get("playerId"))
+
+# Errores de Query cuando el GSI no existe (aún no desplegado)
+_MISSING_INDEX_CODES = frozenset({"ValidationException", "ResourceNotFoundException"})
+
+# La rama already_joined solo usa playerId + validationCode (sin el blob "type")
+_EXISTING_PLAYER_PROJECTION = "gameId, playerId, instagramPSID, validationCode"
 
 def _find_existing_player_by_psid(game_id: str, psid: str) -> dict | None:
     """
     Preferred: query GSI instagramPSID (PK) + gameId (SK).
-    Fallback: query the partition and search (OK for MVP; partitions are small).
+    Fallback (only if the GSI does not exist): query the partition with a
+    FilterExpression on instagramPSID.
     """
     # Try GSI first
     try:
         resp = gp_table.query(
             IndexName=GSI_INSTAGRAM_PSID,
-            KeyConditionExpression=Key("instagramPSID").eq(psid) & Key("gameId").eq(game_id),
+            KeyConditionExpression=_KEY_PSID.eq(psid) & _KEY_GAMEID.eq(game_id),
+            ProjectionExpression=_EXISTING_PLAYER_PROJECTION,
             Limit=1,
         )
         items = resp.get("Items") or []
         return items[0] if items else None
     except ClientError as e:
-        # Index might not exist yet -> fallback
+        # Only a missing index justifies the partition query; transient errors
+        # (throttling, etc.) would hit the partition just the same -> raise
+        if e.response.get("Error", {}).get("Code") not in _MISSING_INDEX_CODES:
+            raise
         log("assign_psid_gsi_unavailable_fallback", {"error": str(e), "index": GSI_INSTAGRAM_PSID})
 
-    # Fallback: query partition and scan in-memory (no Dynamo Scan)
+    # Fallback: query partition filtrando en DynamoDB (no Dynamo Scan); solo
+    # viaja por la red el item que coincide, aunque se cobre lo leído
     try:
         kwargs = {
-            "KeyConditionExpression": Key("gameId").eq(game_id),
-            "ProjectionExpression": "gameId, playerId, instagramPSID, instagramUsername, joinedAt, validated, validationCode, type",
+            "KeyConditionExpression": _KEY_GAMEID.eq(game_id),
+            "FilterExpression": _ATTR_PSID.eq(psid),
+            "ProjectionExpression": _EXISTING_PLAYER_PROJECTION,
+            "Select": "SPECIFIC_ATTRIBUTES",
         }
         while True:
             page = gp_table.query(**kwargs)
-            for it in page.get("Items") or []:
-                if (it.get("instagramPSID") or "") == psid:
-                    return it
+            items = page.get("Items")
+            if items:
+                return items[0]
             lek = page.get("LastEvaluatedKey")
             if not lek:
                 break
@@ -173,81 +405,126 @@ def _find_existing_player_by_psid(game_id: str, psid: str) -> dict | None:
 
     return None
 
+def _put_extra_items(items: list) -> None:
+    """
+    Filas extra que emite un assigner: BatchWriteItem (25 por llamada, reintenta
+    UnprocessedItems) en vez de un PutItem por fila.
+    """
+    with gp_table.batch_writer() as bw:
+        for it in items:
+            bw.put_item(Item=it)
+
+_THROTTLING_CODES = frozenset({
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+})
+
 def _put_player(item: dict) -> None:
-    # Conditional protects races on playerId within same partition
-    gp_table.put_item(
-        Item=item,
-        ConditionExpression="attribute_not_exists(playerId)",
-    )
+    # playerId sale de playerIdSeq (atómico en el game): no hay races que proteger
+    gp_table.put_item(Item=item)
 
 
-def _invoke_quiz_start(game_id: str, psid: str):
+def _invoke_quiz_start(game_id: str, psids, pre_messages=None, no_quiz_messages=None):
+    """
+    Async quiz_start para uno o varios jugadores del mismo game: el quiz ya
+    acepta una lista en "psid", así que va todo en un único invoke.
+
+    pre_messages (welcome, imágenes...) viajan en el payload y el quiz los
+    envía delante de la intro: así el welcome llega antes que la pregunta.
+    no_quiz_messages (el código de validación) solo los envía el quiz si al
+    final no hay quiz que arrancar (config cambiada / caché desfasada).
+    Si no se puede invocar al quiz, se envían ambos directamente.
+    """
+    if isinstance(psids, str):
+        psids = [psids]
+    psids = [p for p in psids if p]
+    pre_messages = list(pre_messages or [])
+    no_quiz_messages = list(no_quiz_messages or [])
+    if not psids:
+        _send_bulk_messages(pre_messages + no_quiz_messages)
+        return
     if not QUIZ_LAMBDA:
         log("assign_quiz_lambda_missing", {"gameId": game_id})
+        _send_bulk_messages(pre_messages + no_quiz_messages)
         return
+
+    payload = {"kind": "quiz_start", "gameId": game_id, "psid": psids}
+    if pre_messages:
+        payload["preMessages"] = pre_messages
+    if no_quiz_messages:
+        payload["noQuizMessages"] = no_quiz_messages
+    body = _payload_bytes(payload)
+    if len(body) > _MAX_PAYLOAD_BYTES:
+        # no cabe en el invoke: el welcome sale por su lado (misma cola FIFO por psid)
+        _send_bulk_messages(pre_messages)
+        payload.pop("preMessages", None)
+        pre_messages = []
+        body = _payload_bytes(payload)
     try:
         lambda_client.invoke(
             FunctionName=QUIZ_LAMBDA,
             InvocationType="Event",
-            Payload=json.dumps({
-                "kind": "quiz_start",
-                "gameId": game_id,
-                "psid": [psid],
-            }, ensure_ascii=False).encode("utf-8"),
+            Payload=body,
         )
     except Exception as e:
-        log("assign_quiz_invoke_error", {"error": repr(e), "quizLambda": QUIZ_LAMBDA})
+        log("assign_quiz_invoke_error", {"error": repr(e), "quizLambda": QUIZ_LAMBDA, "count": len(psids)})
+        _send_bulk_messages(pre_messages + no_quiz_messages)
 
 
-def _invoke_quiz_start_sync(game_id: str, psid: str) -> dict:
-    if not QUIZ_LAMBDA:
-        return {"ok": False, "error": "no_quiz_config"}
-    try:
-        resp = lambda_client.invoke(
-            FunctionName=QUIZ_LAMBDA,
-            InvocationType="RequestResponse",
-            Payload=json.dumps({
-                "kind": "quiz_start",
-                "gameId": game_id,
-                "psid": [psid],
-            }, ensure_ascii=False).encode("utf-8"),
-        )
-        payload_bytes = resp.get("Payload").read() if resp.get("Payload") else b""
-        payload_str = payload_bytes.decode("utf-8", errors="replace").strip()
-        out = json.loads(payload_str) if payload_str else {}
-        print(out)
-        if resp.get("FunctionError"):
-            return {"ok": False, "error": "quiz_function_error", "detail": out}
-        return out if isinstance(out, dict) else {"ok": False, "error": "quiz_bad_payload"}
-    except Exception as e:
-        log("assign_quiz_invoke_error", {"error": repr(e), "quizLambda": QUIZ_LAMBDA})
-        return {"ok": False, "error": "quiz_invoke_error"}
-
+# ========= DM texts =========
+DM_MISSING_USERNAME = (
+    "Necesito tu usuario de Instagram para continuar 😅\n"
+    "Responde con tu @usuario exactamente como aparece en Instagram."
+)
+DM_GAME_NOT_FOUND = "Ese juego no existe o ya no está disponible."
+DM_GAME_INACTIVE = "Este juego ya no está activo."
+DM_ALREADY_JOINED = "Ya estabas dentro del juego ✅\nSi no has completado el quiz, te lo vuelvo a enviar ahora."
+DM_LIMIT_REACHED = (
+    "Este juego ha alcanzado el límite de jugadores 😅\n"
+    "Pide al organizador que amplíe el límite (plan 24h) o cree otra partida."
+)
 
 QUIZ_TAIL = (
     "Antes de jugar, tienes que responder un mini quiz.\n"
     "Cuando lo termines, te enviaré tu código para validar en la pantalla. ✅"
 )
 
+CODE_TAIL_TEMPLATE = "🎟️ Tu código para jugar es: {}\n\nVe a la pantalla, introdúcelo y ¡a jugar! 🚀"
+
 def _code_tail(code) -> str:
-    return f"🎟️ Tu código para jugar es: {code}\n\nVe a la pantalla, introdúcelo y ¡a jugar! 🚀"
+    return CODE_TAIL_TEMPLATE.format(code)
 
 
 
 # ========= Assigners registry =========
-# Import here (not top) to avoid circular imports
-from assigners.empareja2 import assign_empareja2
-from assigners.t1mer import assign_t1mer
-from assigners.rulet4 import assign_rulet4
-from assigners.semaforo import assign_semaforo
-from assigners.generic import assign_generic
-
+# "module:function" -> se importa en el primer uso (empareja2 crea un cliente
+# S3 al importarse; no tiene sentido pagarlo en cold start de otros juegos)
 ASSIGNERS = {
-    "EMPAREJA2": assign_empareja2,
-    "T1MER": assign_t1mer,
-    "RULET4": assign_rulet4,
-    "SEMAFORO": assign_semaforo,
+    "EMPAREJA2": "assigners.empareja2:assign_empareja2",
+    "T1MER": "assigners.t1mer:assign_t1mer",
+    "RULET4": "assigners.rulet4:assign_rulet4",
+    "SEMAFORO": "assigners.semaforo:assign_semaforo",
 }
+GENERIC_ASSIGNER = "assigners.generic:assign_generic"
+
+_ASSIGNER_CACHE = {}
+
+def _get_assigner(game_type: str):
+    path = ASSIGNERS.get(game_type, GENERIC_ASSIGNER)
+    fn = _ASSIGNER_CACHE.get(path)
+    if fn is None:
+        mod_name, fn_name = path.split(":", 1)
+        fn = _ASSIGNER_CACHE[path] = getattr(importlib.import_module(mod_name), fn_name)
+    return fn
+
+# Opcional: importa durante el init el assigner del juego más habitual
+# (p.ej. PREWARM_ASSIGNER=EMPAREJA2) para no pagarlo en la primera invocación
+if os.environ.get("PREWARM_ASSIGNER"):
+    try:
+        _get_assigner(os.environ["PREWARM_ASSIGNER"].strip().upper())
+    except Exception as e:
+        log("assign_prewarm_assigner_failed", {"error": repr(e)})
 
 def lambda_handler(event, context):
     """
@@ -270,40 +547,41 @@ def lambda_handler(event, context):
             return {"ok": False, "reason": "missing psid or game_id"}
 
         if not username_at:
-            _send_single_dm(
-                psid,
-                "Necesito tu usuario de Instagram para continuar 😅\n"
-                "Responde con tu @usuario exactamente como aparece en Instagram."
-            )
+            _send_single_dm(psid, DM_MISSING_USERNAME)
             log("assign_missing_username", {"psid": psid, "gameId": game_id})
             return {"ok": False, "reason": "missing username_at"}
 
-        # 2) load game meta
-        meta = _get_game_meta(game_id)
+        # 2) load game meta + existing player lookup (independientes -> en paralelo)
+        fut_meta = _pool.submit(_get_game_meta, game_id)
+        fut_existing = _pool.submit(_find_existing_player_by_psid, game_id, psid)
+
+        meta = fut_meta.result()
         if not meta:
-            _send_single_dm(psid, "Ese juego no existe o ya no está disponible.")
+            _send_single_dm(psid, DM_GAME_NOT_FOUND)
             return {"ok": False, "reason": "game_not_found"}
 
         if not meta.get("isActive", True):
-            _send_single_dm(psid, "Este juego ya no está activo.")
+            _send_single_dm(psid, DM_GAME_INACTIVE)
             return {"ok": False, "reason": "game_inactive"}
 
         game_type = (meta.get("gameType") or "UNKNOWN").upper()
-        max_players_raw = meta.get("maxPlayers") or 9999
-        max_players = int(max_players_raw) if not isinstance(max_players_raw, Decimal) else int(max_players_raw)
 
         # 3) idempotency: if already joined, do not create again
-        existing = _find_existing_player_by_psid(game_id, psid)
+        existing = fut_existing.result()
         if existing:
             pid = existing.get("playerId")
-            _send_single_dm(psid, "Ya estabas dentro del juego ✅\nSi no has completado el quiz, te lo vuelvo a enviar ahora.")
-            qr = _invoke_quiz_start_sync(game_id, psid)
-            # If quiz is not configured, reveal the code immediately
-            if (qr or {}).get("ok") is False and (qr or {}).get("error") == "no_quiz_config":
-                code = existing.get("validationCode")
-                if code is not None:
-                    _send_code_now(psid, code)
-            log("assign_already_joined", {"gameId": game_id, "psid": psid, "playerId": pid})
+            msgs = [{"psid": psid, "text": DM_ALREADY_JOINED}]
+            code = existing.get("validationCode")
+            code_msgs = [{"psid": psid, "text": _code_tail(code)}] if code is not None else []
+            if meta.get("quizOrder"):
+                # el aviso va dentro del quiz_start, delante de la pregunta; el
+                # código solo si el quiz no llega a arrancar
+                _invoke_quiz_start(game_id, psid, msgs, code_msgs)
+            else:
+                # no quiz -> reveal the code again
+                _send_bulk_messages(msgs + code_msgs)
+            if DEBUG:
+                log("assign_already_joined", {"gameId": game_id, "psid": psid, "playerId": pid})
             return _json_sanitize({
                 "ok": True,
                 "created_new": False,
@@ -313,125 +591,130 @@ def lambda_handler(event, context):
                 "player": existing,
             })
 
-        # 4) counters + enforce maxPlayers (atómico, sin contar en gp_table)
-        attempts = 6
+        # 4) counters + enforce isActive/maxPlayers + playerId (un solo update
+        #    condicional, sin contar en gp_table). ADD crea playersCount si no
+        #    existe, así que games antiguos sin counters no necesitan init.
         now = _iso_now()
 
-        # compat: games antiguos pueden no tener counters
-        try:
-            _ensure_game_counters(game_id)
-        except Exception as e:
-            log("assign_ensure_counters_failed", {"error": repr(e), "gameId": game_id})
-
-        reserved = _reserve_player_slot(game_id, max_players, now)
-        if not reserved:
-            _send_single_dm(
-                psid,
-                "Este juego ha alcanzado el límite de jugadores 😅\n"
-                "Pide al organizador que amplíe el límite (plan 24h) o cree otra partida."
-            )
+        # compat: games anteriores a playerIdSeq arrancan la secuencia desde el
+        # último playerId existente (solo la primera vez)
+        seq_base = 0 if "playerIdSeq" in meta else _get_last_player_id(game_id)
+
+        new_pid = _reserve_player_slot(game_id, now, seq_base)
+        if new_pid is None:
+            # slow path: releemos el game (sin caché) para saber qué condición falló
+            fresh = _get_game_meta(game_id, use_cache=False)
+            if not fresh:
+                _send_single_dm(psid, DM_GAME_NOT_FOUND)
+                return {"ok": False, "reason": "game_not_found"}
+            if not fresh.get("isActive", True):
+                _send_single_dm(psid, DM_GAME_INACTIVE)
+                return {"ok": False, "reason": "game_inactive"}
+
+            max_players = _max_players(fresh)
+            _send_single_dm(psid, DM_LIMIT_REACHED)
             log("assign_limit_reached_atomic", {"gameId": game_id, "max": max_players})
             return {"ok": False, "reason": "player_limit_reached", "maxPlayers": max_players}
 
-        # 5) allocate playerId + write (retry on race)
-        for _ in range(attempts):
-            last_pid = _get_last_player_id(game_id)
-            new_pid = int(last_pid) + 1
+        # 5) build + write player (playerId ya es único: sin retries)
+        base_item = {
+            "gameId": game_id,
+            "playerId": new_pid,
+            "instagramPSID": psid,
+            "instagramUsername": username_at,
+            "joinedAt": now,
+            "validated": False,
+            "validationCode": _code4(),
+        }
 
-            base_item = {
-                "gameId": game_id,
-                "playerId": new_pid,
-                "instagramPSID": psid,
-                "instagramUsername": username_at,
-                "joinedAt": now,
-                "validated": False,
-                "validationCode": _code4(),
-            }
-
-            assigner = ASSIGNERS.get(game_type, assign_generic)
-            ctx = {
+        assigner = _get_assigner(game_type)
+        ctx = {
+            "gameId": game_id,
+            "playerId": new_pid,
+            "psid": psid,
+            "username_at": username_at,
+            "gameType": game_type,
+            "gameMeta": meta,
+            "now": now,
+            "dynamo_r": dynamo_r,
+            "lambda_client": lambda_client,
+            "log_fn": log,
+            "validationCode": base_item["validationCode"],
+        }
+
+        # assigner contract: (patch, welcome_header, extra_messages[, extra_items])
+        #   extra_items: optional extra gp_table rows, written after the player
+        result = assigner(ctx)
+        patch, welcome_header, extra_messages = result[:3]
+        extra_items = result[3] if len(result) > 3 else None
+
+        # merge patch into base_item BEFORE writing
+        if patch:
+            for k, v in patch.items():
+                base_item[k] = v
+
+        try:
+            _put_player(base_item)
+        except ClientError as e:
+            # rollback reserva (best-effort). Un ClientError garantiza que el put
+            # NO se escribió, así que devolvemos la plaza también en throttling:
+            # el reintento del caller reserva la suya con su propio ADD.
+            try:
+                _rollback_player_slot(game_id, now)
+            except Exception as re:
+                log("assign_playersCount_rollback_failed", {"error": repr(re), "gameId": game_id})
+
+            code = e.response.get("Error", {}).get("Code")
+            log("assign_put_failed", {"error": str(e), "code": code, "gameId": game_id, "playerId": new_pid})
+            if code in _THROTTLING_CODES:
+                return {"ok": False, "reason": "throttled", "retryable": True, "detail": str(e)}
+            return {"ok": False, "reason": "put_failed", "detail": str(e)}
+
+        if extra_items:
+            try:
+                _put_extra_items(extra_items)
+            except Exception as e:
+                log("assign_extra_items_failed", {"error": repr(e), "gameId": game_id, "count": len(extra_items)})
+
+        # 1) extra messages (images, etc.) + welcome header (NO quiz mention here)
+        #    + code if the game has no quiz -> one single sender invoke
+        #    (the sender processes the list in order)
+        # 2) with quiz, the same messages travel in the async quiz_start
+        #    (fire-and-forget) and the quiz lambda sends them ahead of the
+        #    intro + first question, so the welcome always comes first
+        quiz_enabled = bool(meta.get("quizOrder"))
+        msgs = list(extra_messages or [])
+        if welcome_header:
+            msgs.append({"psid": psid, "text": welcome_header})
+        code_msgs = [{"psid": psid, "text": _code_tail(base_item["validationCode"])}]
+        if quiz_enabled:
+            _invoke_quiz_start(game_id, psid, msgs, code_msgs)
+        else:
+            _send_bulk_messages(msgs + code_msgs)
+        no_quiz = not quiz_enabled
+
+        if DEBUG:
+            log("assign_ok", {
                 "gameId": game_id,
-                "playerId": new_pid,
                 "psid": psid,
                 "username_at": username_at,
                 "gameType": game_type,
-                "gameMeta": meta,
-                "now": now,
-                "dynamo_r": dynamo_r,
-                "lambda_client": lambda_client,
-                "log_fn": log,
-                "validationCode": base_item["validationCode"],
-            }
-
-            # assigner contract: (patch, welcome_header, extra_messages)
-            patch, welcome_header, extra_messages = assigner(ctx)
-
-            # merge patch into base_item BEFORE writing
-            if patch:
-                for k, v in patch.items():
-                    base_item[k] = v
-
-            try:
-                _put_player(base_item)
-
-                # 1) send extra messages first (images, etc.)
-                if extra_messages:
-                    _send_bulk_messages(extra_messages)
-
-                # 2) send welcome header (NO quiz mention here)
-                if welcome_header:
-                    _send_single_dm(psid, welcome_header)
-
-                time.sleep(1)
-                # 3) attempt to start quiz (sync)
-                qr = _invoke_quiz_start_sync(game_id, psid)
-                no_quiz = (qr or {}).get("ok") is False and (qr or {}).get("error") == "no_quiz_config"
-
-                # 4) if no quiz, send code now
-                if no_quiz:
-                    _send_single_dm(psid, _code_tail(base_item["validationCode"]))
-
-                log("assign_ok", {
-                    "gameId": game_id,
-                    "psid": psid,
-                    "username_at": username_at,
-                    "gameType": game_type,
-                    "playerId": new_pid,
-                    "created_new": True,
-                    "no_quiz": no_quiz,
-                })
-
-                safe = _json_sanitize(base_item)
-                return {
-                    "ok": True,
-                    "created_new": True,
-                    "gameId": game_id,
-                    "gameType": game_type,
-                    "player": safe,
-                    "quizStart": qr,
-                }
-
-            except ClientError as e:
-                if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-                    # race on playerId -> retry (NO rollback, already reserved slot)
-                    continue
-
-                # rollback reserva (best-effort)
-                try:
-                    _rollback_player_slot(game_id, now)
-                except Exception as re:
-                    log("assign_playersCount_rollback_failed", {"error": repr(re), "gameId": game_id})
-
-                log("assign_put_failed", {"error": str(e), "gameId": game_id})
-                return {"ok": False, "reason": "put_failed", "detail": str(e)}
-        # si agotamos retries por race: rollback reserva
-        try:
-            _rollback_player_slot(game_id, now)
-        except Exception as re:
-            log("assign_playersCount_rollback_failed", {"error": repr(re), "gameId": game_id})
+                "playerId": new_pid,
+                "created_new": True,
+                "no_quiz": no_quiz,
+            })
 
-        log("assign_race_exhausted", {"gameId": game_id, "psid": psid})
-        return {"ok": False, "reason": "race_condition_retry_exhausted"}
+        # base_item se construye aquí (ints/str/bool; los patches tampoco traen
+        # Decimals), así que no hace falta _json_sanitize: solo lo necesitan los
+        # items leídos de DynamoDB (rama already_joined)
+        return {
+            "ok": True,
+            "created_new": True,
+            "gameId": game_id,
+            "gameType": game_type,
+            "player": base_item,
+            "quizStarted": quiz_enabled,
+        }
 
 
     except Exception as e:
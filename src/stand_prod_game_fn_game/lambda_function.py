@@ -1,12 +1,15 @@
 import os
 import json
+import base64
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from datetime import datetime, timezone
 
 import boto3
+from boto3.dynamodb.types import TypeDeserializer
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
 
 # ========= ENV VARS =========
 GAMES_TABLE = os.environ.get("GAMES_TABLE", "stand-prod-game-table")
@@ -20,75 +23,110 @@ GSI_GAMENAME = os.environ.get("GSI_GAMENAME", "gsi-gameName")  # optional; only
 
 # ========= AWS =========
 dynamodb = boto3.resource("dynamodb")
+# Cliente low-level para el GET por gameId (sin la capa del resource); el item
+# se convierte con el TypeDeserializer de boto3
+dynamo_c = boto3.client("dynamodb")
+_deser = TypeDeserializer()
 games_table = dynamodb.Table(GAMES_TABLE)
 users_table = dynamodb.Table(USERS_TABLE)
 gp_table = dynamodb.Table(GAMEPLAYER_TABLE)
 catalog_table = dynamodb.Table(CATALOG_TABLE)
 
+# Para solapar lecturas independientes (checks previos del POST); boto3 suelta el GIL en I/O
+_pool = ThreadPoolExecutor(max_workers=3)
+
 # ========= CONST =========
 SUPPORTED_GAME_TYPES = {"EMPAREJA2", "T1MER", "RULET4", "L3TRAS", "SEMAFORO"}
 
 # numeric 6 digits 
-JOIN_CODE_ALPHABET = "0123456789"
 JOIN_CODE_LENGTH = 6
 JOIN_CODE_MAX_ATTEMPTS = 10
+JOIN_CODE_BATCH = 5  # candidatos comprobados de golpe antes del put
+
+# Quiz por defecto del catálogo, por gameType (cambia muy poco; TTL por si se edita)
+_QUIZ_CACHE = {}
+_QUIZ_TTL_S = float(os.environ.get("QUIZ_CACHE_TTL_S", "300"))
+# un gameType sin quiz se re-consulta pronto: si se da de alta, se ve enseguida
+_QUIZ_MISS_TTL_S = 10.0
 
 HEADERS = {"Content-Type": "application/json"}
 
+def _json_default(o):
+    """
+    Hook `default` de json.dumps: convierte Decimals de DynamoDB a int/float.
+    Solo se invoca para tipos no serializables, sin recorrer dict/list en Python.
+    """
+    if isinstance(o, Decimal):
+        # si es entero -> int, si no -> float
+        return int(o) if o % 1 == 0 else float(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+# Encoder único: json.dumps con kwargs construye un JSONEncoder nuevo en cada llamada
+_json_encode = json.JSONEncoder(ensure_ascii=False, default=_json_default).encode
+
 def log(msg, obj=None):
     if obj is not None:
-        print(json.dumps({"msg": msg, "data": obj}, ensure_ascii=False))
+        print(_json_encode({"msg": msg, "data": obj}))
     else:
-        print(json.dumps({"msg": msg}, ensure_ascii=False))
+        print(_json_encode({"msg": msg}))
 
 def _resp(status, body):
     if not isinstance(body, str):
-        body = json.dumps(_json_sanitize(body), ensure_ascii=False)
+        body = _json_encode(body)
     return {
         "statusCode": int(status),
         "headers": HEADERS,
-        "body": body,
-        "isBase64Encoded": False,
+        "body": body,  # isBase64Encoded por defecto es False: no hace falta mandarlo
     }
 
-def _json_sanitize(obj):
-    """
-    Convierte Decimals de DynamoDB a int/float para que json.dumps no falle.
-    Mantiene dict/list recursivamente.
-    """
-    if isinstance(obj, Decimal):
-        # si es entero -> int, si no -> float
-        return int(obj) if obj % 1 == 0 else float(obj)
-    if isinstance(obj, dict):
-        return {k: _json_sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_json_sanitize(v) for v in obj]
-    return obj
-
 def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    # mismo formato que isoformat() + "Z" (con microsegundos), sin el replace
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
 def _get_claims(event: dict) -> dict:
-    rc = (event or {}).get("requestContext") or {}
-    auth = rc.get("authorizer") or {}
-    jwt = auth.get("jwt") or {}
-    return jwt.get("claims") or auth.get("claims") or {}
+    # Camino normal (HTTP API + JWT authorizer): subscripts directos
+    try:
+        auth = event["requestContext"]["authorizer"]
+    except (KeyError, TypeError):
+        return {}
+    try:
+        claims = auth["jwt"]["claims"]
+        if claims:
+            return claims
+    except (KeyError, TypeError):
+        pass
+    # REST API / Lambda authorizer
+    return (auth.get("claims") if isinstance(auth, dict) else None) or {}
 
 def _read_json_body(event):
-    raw = event.get("body") or "{}"
+    raw = event.get("body")
+    if not raw:
+        return {}
     try:
-        return json.loads(raw) if isinstance(raw, str) else (raw or {})
+        # Camino normal (HTTP API): body ya es str JSON, sin más comprobaciones
+        if not event.get("isBase64Encoded"):
+            return json.loads(raw)
+        return json.loads(base64.b64decode(raw))
+    except TypeError:
+        # invocación directa con body ya deserializado (dict)
+        return raw if isinstance(raw, dict) else None
     except Exception:
         return None
 
 def _get_query_params(event):
     return event.get("queryStringParameters") or {}
 
+def _as_int(v, default: int = 0) -> int:
+    try:
+        return int(v)
+    except Exception:
+        return default
+
 def _parse_iso_dt(s: str):
     if not s or not isinstance(s, str):
         return None
     try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+        return datetime.fromisoformat(s)
     except Exception:
         return None
 
@@ -108,7 +146,36 @@ def _get_user(user_id: str):
     return resp.get("Item")
 
 def _new_join_code(length: int = JOIN_CODE_LENGTH) -> str:
-    return "".join(random.choice(JOIN_CODE_ALPHABET) for _ in range(length))
+    # un solo randrange + padding con ceros (mismo espacio que 6 dígitos sueltos)
+    return f"{random.randrange(10 ** length):0{length}d}"
+
+def _free_join_codes(n: int = JOIN_CODE_BATCH) -> list:
+    """
+    Genera n códigos y descarta los que ya existen con un solo BatchGetItem.
+    El put sigue siendo condicional (carrera con otro create concurrente).
+    """
+    cands = list({_new_join_code() for _ in range(n)})
+    try:
+        resp = dynamo_c.batch_get_item(RequestItems={
+            GAMES_TABLE: {
+                "Keys": [{"gameId": {"S": c}} for c in cands],
+                "ProjectionExpression": "gameId",
+            }
+        })
+    except ClientError as e:
+        log("Join code precheck failed", {"error": str(e)})
+        return cands
+
+    # UnprocessedKeys se quedan como candidatos: el put condicional decide
+    taken = {it["gameId"]["S"] for it in (resp.get("Responses") or {}).get(GAMES_TABLE) or []}
+    return [c for c in cands if c not in taken]
+
+# Bookkeeping del servidor (copia del plan del owner, contador de playerId):
+# se guardan en el item pero no salen en las respuestas
+_INTERNAL_GAME_FIELDS = ("ownerPlan", "ownerActiveUntil", "playerIdSeq")
+
+def _without_internal_fields(item: dict) -> dict:
+    return {k: v for k, v in item.items() if k not in _INTERNAL_GAME_FIELDS}
 
 def _public_game_shape(item: dict) -> dict:
     # Safe shape for clients/players
@@ -120,6 +187,24 @@ def _public_game_shape(item: dict) -> dict:
         "maxPlayers": item.get("maxPlayers"),
     }
 
+# Key conditions como string fijo: solo cambian los valores (sin builder Key().eq())
+_OWNER_KCE = "ownerUserId = :o"
+_GAMENAME_KCE = "gameName = :n"
+_CATALOG_KCE = "catalogId = :c"
+
+# Solo lo que devuelve _public_game_shape: evita traer quizQuestions (lo más pesado)
+_PUBLIC_GAME_PROJECTION = "gameId, gameName, gameType, createdAt, maxPlayers"
+# GET por gameId: además owner/isActive para los checks
+_GAMEID_GET_PROJECTION = _PUBLIC_GAME_PROJECTION + ", ownerUserId, isActive"
+# GET por gameName: además owner/isActive (filtros) y contadores/quiz/raffle
+_GAMENAME_GET_PROJECTION = (
+    _PUBLIC_GAME_PROJECTION
+    + ", ownerUserId, isActive, playersCount, validatedCount, raffleWinners, quizOrder"
+)
+
+def _created_at_key(item: dict) -> str:
+    return item.get("createdAt") or ""
+
 def _quiz_enabled_from_game(game_item: dict) -> bool:
     order = game_item.get("quizOrder") or []
     return isinstance(order, list) and len(order) > 0
@@ -137,36 +222,55 @@ def _get_path(event):
         or ""
     )
 
-def _load_default_quiz_from_catalog(game_type: str, game_id: str):
+def _query_compiled_quiz(catalog_id: str):
     """
-    Returns (quizOrder, quizQuestions) or (None, None)
+    Fila precompilada por el seed ({catalogId}#COMPILED): una sola lectura con
+    las preguntas ya ordenadas en quizTemplate.questions. None si no existe.
+    """
+    resp = catalog_table.query(
+        KeyConditionExpression=_CATALOG_KCE,
+        ExpressionAttributeValues={":c": f"{catalog_id}#COMPILED"},
+        ProjectionExpression="quizTemplate",
+        Limit=1,
+    )
+    items = resp.get("Items") or []
+    if not items:
+        return None
+    return (items[0].get("quizTemplate") or {}).get("questions") or None
+
+def _query_catalog_questions(catalog_id: str) -> list:
+    # Fallback: una fila por pregunta. Un quiz cabe de sobra en una página
+    # (<1MB), así que una sola query; si alguna vez pagina, lo dejamos en log.
+    resp = catalog_table.query(
+        KeyConditionExpression=_CATALOG_KCE,
+        ExpressionAttributeValues={":c": catalog_id},
+        Limit=500,
+    )
+    items = resp.get("Items") or []
+    if resp.get("LastEvaluatedKey"):
+        log("Quiz catalog truncated", {"catalogId": catalog_id, "count": len(items)})
+
+    # ordenar por orderIndex
+    items.sort(key=lambda x: int(x.get("orderIndex", 0)))
+    return items
+
+def _query_quiz_catalog(game_type: str):
+    """
+    Lee el quiz del catálogo y lo deja "digerido" sin gameId:
+      (quizOrder tuple, {qid: (text, ((title, answerId), ...))}) o (None, None)
     """
     # TODO: now hardcoded to use always v1
     catalog_id = f"{game_type}#QUIZ#v1"
 
-    items = []
-    last = None
-    while True:
-        kwargs = {
-            "KeyConditionExpression": Key("catalogId").eq(catalog_id),
-        }
-        if last:
-            kwargs["ExclusiveStartKey"] = last
-
-        resp = catalog_table.query(**kwargs)
-        items.extend(resp.get("Items") or [])
-        last = resp.get("LastEvaluatedKey")
-        if not last:
-            break
+    items = _query_compiled_quiz(catalog_id)
+    if items is None:
+        items = _query_catalog_questions(catalog_id)
 
     if not items:
         return None, None
 
-    # ordenar por orderIndex
-    items.sort(key=lambda x: int(x.get("orderIndex", 0)))
-
     quiz_order = []
-    quiz_questions = {}
+    template = {}
 
     for it in items:
         qid = it.get("questionId")
@@ -177,22 +281,39 @@ def _load_default_quiz_from_catalog(game_type: str, game_id: str):
             continue
 
         quiz_order.append(qid)
+        template[qid] = (text, tuple((o["title"], o["answerId"]) for o in options))
 
-        quiz_questions[qid] = {
-            "text": text,
-            "options": [
-                {
-                    "title": o["title"],
-                    "payload": f"{game_id}_{qid}_{o['answerId']}",
-                }
-                for o in options
-            ],
-        }
+    if not quiz_order:
+        return None, None
+
+    return tuple(quiz_order), template
 
+def _load_default_quiz_from_catalog(game_type: str, game_id: str):
+    """
+    Returns (quizOrder, quizQuestions) or (None, None)
+    """
+    now = time.monotonic()
+    cached = _QUIZ_CACHE.get(game_type)
+    if cached is None or now - cached[0] > (_QUIZ_TTL_S if cached[1] else _QUIZ_MISS_TTL_S):
+        quiz_order, template = _query_quiz_catalog(game_type)
+        cached = _QUIZ_CACHE[game_type] = (now, quiz_order, template)
+
+    _, quiz_order, template = cached
     if not quiz_order:
         return None, None
 
-    return quiz_order, quiz_questions
+    # solo el payload depende del gameId: se monta en cada create
+    quiz_questions = {
+        qid: {
+            "text": text,
+            "options": [
+                {"title": title, "payload": f"{game_id}_{qid}_{answer_id}"}
+                for title, answer_id in options
+            ],
+        }
+        for qid, (text, options) in template.items()
+    }
+    return list(quiz_order), quiz_questions
 
 
 # ---------------- GET ----------------
@@ -221,8 +342,13 @@ def _handle_get(event):
     # ---------------- 1) gameId ----------------
     if game_id:
         try:
-            resp = games_table.get_item(Key={"gameId": game_id})
-            item = resp.get("Item")
+            resp = dynamo_c.get_item(
+                TableName=GAMES_TABLE,
+                Key={"gameId": {"S": game_id}},
+                ProjectionExpression=_GAMEID_GET_PROJECTION,
+            )
+            raw = resp.get("Item")
+            item = {k: _deser.deserialize(v) for k, v in raw.items()} if raw else None
         except ClientError as e:
             log("GetItem failed", {"error": str(e)})
             return _resp(500, {"error": "GetItemFailed", "detail": str(e)})
@@ -244,8 +370,10 @@ def _handle_get(event):
         try:
             q = games_table.query(
                 IndexName=GSI_GAMENAME,
-                KeyConditionExpression=Key("gameName").eq(game_name),
+                KeyConditionExpression=_GAMENAME_KCE,
+                ExpressionAttributeValues={":n": game_name},
                 Limit=5,
+                ProjectionExpression=_GAMENAME_GET_PROJECTION,
             )
             items = q.get("Items", []) or []
         except ClientError as e:
@@ -268,26 +396,9 @@ def _handle_get(event):
         game_id = item.get("gameId")
         game_type = (item.get("gameType") or "").upper() or "UNKNOWN"
 
-        # ✅ Cache counters en games_table (de assign/validate)
-        player_count = item.get("playersCount", 0)
-        validated_count = item.get("validatedCount", 0)
-
-        # sanitiza Decimal -> int
-        try:
-            if isinstance(player_count, Decimal):
-                player_count = int(player_count)
-            else:
-                player_count = int(player_count)
-        except Exception:
-            player_count = 0
-
-        try:
-            if isinstance(validated_count, Decimal):
-                validated_count = int(validated_count)
-            else:
-                validated_count = int(validated_count)
-        except Exception:
-            validated_count = 0
+        # ✅ Cache counters en games_table (de assign/validate), Decimal -> int
+        player_count = _as_int(item.get("playersCount"))
+        validated_count = _as_int(item.get("validatedCount"))
 
         return _resp(200, {
             "ok": True,
@@ -309,20 +420,32 @@ def _handle_get(event):
             "supportedGameTypes": sorted(SUPPORTED_GAME_TYPES),
         })
 
+    # gsi-ownerUserId no tiene sort key: el orden por createdAt sigue siendo nuestro.
+    # El filtro por gameType sí va a DynamoDB (gameType se guarda siempre en mayúsculas)
+    kwargs = {
+        "IndexName": GSI_OWNER,
+        "KeyConditionExpression": _OWNER_KCE,
+        "ExpressionAttributeValues": {":o": owner_user_id},
+        "ProjectionExpression": _PUBLIC_GAME_PROJECTION,
+    }
+    if game_type:
+        kwargs["FilterExpression"] = "gameType = :t"
+        kwargs["ExpressionAttributeValues"][":t"] = game_type
+
+    items = []
     try:
-        q = games_table.query(
-            IndexName=GSI_OWNER,
-            KeyConditionExpression=Key("ownerUserId").eq(owner_user_id),
-        )
-        items = q.get("Items") or []
+        while True:
+            q = games_table.query(**kwargs)
+            items.extend(q.get("Items") or [])
+            lek = q.get("LastEvaluatedKey")
+            if not lek:
+                break
+            kwargs["ExclusiveStartKey"] = lek
     except ClientError as e:
         log("Owner query failed", {"error": str(e)})
         return _resp(500, {"error": "OwnerQueryFailed", "detail": str(e)})
 
-    if game_type:
-        items = [it for it in items if (it.get("gameType") or "").upper() == game_type]
-
-    items.sort(key=lambda x: (x.get("createdAt") or ""), reverse=True)
+    items.sort(key=_created_at_key, reverse=True)
 
     return _resp(200, {
         "ok": True,
@@ -364,37 +487,54 @@ def _handle_post(event):
             "supportedGameTypes": sorted(SUPPORTED_GAME_TYPES),
         })
 
-    # Plan enforcement: FREE => only 1 game
-    user_item = _get_user(owner_user_id)
-    is_pro = _is_user_pro(user_item)
+    # Los checks previos son independientes: la query de unicidad de gameName
+    # corre en paralelo con la del owner (+ GetItem del user si hace falta)
+    f_name = None
+    if game_name:
+        # Optional: enforce unique gameName (ONLY if you created gsi-gameName)
+        f_name = _pool.submit(
+            games_table.query,
+            IndexName=GSI_GAMENAME,
+            KeyConditionExpression=_GAMENAME_KCE,
+            ExpressionAttributeValues={":n": game_name},
+            Limit=1,
+            ProjectionExpression="gameId",
+        )
 
-    if not is_pro:
-        try:
-            q = games_table.query(
-                IndexName=GSI_OWNER,
-                KeyConditionExpression=Key("ownerUserId").eq(owner_user_id),
-                Limit=1,
-                ProjectionExpression="gameId",
-            )
-        except ClientError as e:
-            log("Owner query failed", {"error": str(e)})
-            return _resp(500, {"error": "OwnerQueryFailed", "detail": str(e)})
+    # Plan enforcement: FREE => only 1 game
+    # Cada partida guarda una copia del plan del owner (ownerPlan/ownerActiveUntil).
+    # Un plan de pago solo "baja" al caducar activeUntil, así que si la copia dice
+    # PRO vigente nos ahorramos el GetItem del user; si no, leemos el user real.
+    try:
+        q = games_table.query(
+            IndexName=GSI_OWNER,
+            KeyConditionExpression=_OWNER_KCE,
+            ExpressionAttributeValues={":o": owner_user_id},
+            Limit=1,
+            ProjectionExpression="gameId, ownerPlan, ownerActiveUntil",
+        )
+    except ClientError as e:
+        log("Owner query failed", {"error": str(e)})
+        return _resp(500, {"error": "OwnerQueryFailed", "detail": str(e)})
 
-        if q.get("Items"):
-            return _resp(403, {
-                "error": "FREE plan limit reached",
-                "detail": "On FREE you can only create 1 game. Upgrade to create more."
-            })
+    owned = q.get("Items") or []
+    plan_item = None
+    if owned:
+        stamp = owned[0]
+        plan_item = {"plan": stamp.get("ownerPlan"), "activeUntil": stamp.get("ownerActiveUntil")}
+    if not _is_user_pro(plan_item):
+        plan_item = _get_user(owner_user_id) or {}
+    is_pro = _is_user_pro(plan_item)
+
+    if not is_pro and owned:
+        return _resp(403, {
+            "error": "FREE plan limit reached",
+            "detail": "On FREE you can only create 1 game. Upgrade to create more."
+        })
 
-    # Optional: enforce unique gameName (ONLY if you created gsi-gameName)
-    if game_name:
+    if f_name is not None:
         try:
-            existing = games_table.query(
-                IndexName=GSI_GAMENAME,
-                KeyConditionExpression=Key("gameName").eq(game_name),
-                Limit=1,
-                ProjectionExpression="gameId",
-            )
+            existing = f_name.result()
             if existing.get("Items"):
                 return _resp(409, {"error": "Game name already exists.", "gameName": game_name})
         except ClientError as e:
@@ -408,22 +548,31 @@ def _handle_post(event):
     game_id = None
     last_err = None
 
+    # Campos comunes a todos los intentos; los opcionales solo si tienen valor
+    base = {
+        "ownerUserId": owner_user_id,
+        "gameType": game_type,
+        "ownerPlan": (plan_item.get("plan") or "FREE").upper().strip(),
+        "isActive": True,
+        "maxPlayers": max_players,
+        "playersCount": 0,
+        "validatedCount": 0,
+        "playerIdSeq": 0,
+        "raffleWinners": [],
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    if game_name:
+        base["gameName"] = game_name
+    if plan_item.get("activeUntil"):
+        base["ownerActiveUntil"] = plan_item["activeUntil"]
+
+    # candidatos ya filtrados con un BatchGetItem; si se agotan, a ciegas como antes
+    candidates = _free_join_codes()
+
     for _ in range(JOIN_CODE_MAX_ATTEMPTS):
-        candidate = _new_join_code()
-        item = {
-            "gameId": candidate,
-            "ownerUserId": owner_user_id,
-            "gameType": game_type,
-            "gameName": game_name or None,
-            "isActive": True,
-            "maxPlayers": max_players,
-            "playersCount": 0,
-            "validatedCount": 0,
-            "raffleWinners": [],
-            "createdAt": now,
-            "updatedAt": now,
-        }
-        item = {k: v for k, v in item.items() if v is not None}
+        candidate = candidates.pop() if candidates else _new_join_code()
+        item = {"gameId": candidate, **base}
 
         quiz_order, quiz_questions = _load_default_quiz_from_catalog(game_type, candidate)
 
@@ -437,7 +586,7 @@ def _handle_post(event):
                 ConditionExpression="attribute_not_exists(gameId)",
             )
             game_id = candidate
-            return _resp(201, {"message": "Game created successfully", "game": item})
+            return _resp(201, {"message": "Game created successfully", "game": _without_internal_fields(item)})
         except ClientError as e:
             code = e.response["Error"]["Code"]
             if code == "ConditionalCheckFailedException":
@@ -499,7 +648,7 @@ def _handle_put(event):
         log("Update failed", {"error": str(e)})
         return _resp(500, {"error": "UpdateFailed", "detail": str(e)})
 
-    return _resp(200, {"message": "Game updated successfully", "game": attrs})
+    return _resp(200, {"message": "Game updated successfully", "game": _without_internal_fields(attrs)})
 
 # ---------------- DELETE ----------------
 
@@ -538,29 +687,28 @@ def _handle_delete(event):
 
 # ---------------- Router ----------------
 
+_DISPATCH = {
+    "GET": _handle_get,
+    "POST": _handle_post,
+    "PUT": _handle_put,
+    "DELETE": _handle_delete,
+}
+
 def lambda_handler(event, context):
-    method = (
-        event.get("httpMethod")
-        or event.get("requestContext", {}).get("http", {}).get("method", "POST")
-    )
+    method = event.get("httpMethod")
+    if not method:
+        http = (event.get("requestContext") or {}).get("http") or {}
+        method = http.get("method", "POST")
 
     try:
         if method == "OPTIONS":
             return _resp(204, "")
 
-        if method == "GET":
-            return _handle_get(event)
-
-        if method == "POST":
-            return _handle_post(event)
-
-        if method == "PUT":
-            return _handle_put(event)
-
-        if method == "DELETE":
-            return _handle_delete(event)
+        handler = _DISPATCH.get(method)
+        if handler is None:
+            return _resp(405, {"error": f"Method {method} not allowed"})
 
-        return _resp(405, {"error": f"Method {method} not allowed"})
+        return handler(event)
 
     except Exception as e:
         log("UnhandledError", {"error": str(e)})
@@ -1,11 +1,15 @@
 import os
 import json
 import base64
+import random
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from decimal import Decimal
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 
@@ -13,44 +17,66 @@ from boto3.dynamodb.conditions import Key
 GAMES_TABLE = os.environ.get("GAMES_TABLE", "stand-prod-game-table")
 GAMEPLAYER_TABLE = os.environ.get("GAMEPLAYER_TABLE", "stand-prod-gameplayer-table")
 IG_SENDER_LAMBDA = os.environ.get("IG_SENDER_LAMBDA", "instagram-sender")
+IG_SENDER_QUEUE_URL = os.environ.get("IG_SENDER_QUEUE_URL", "")
 # ==================================
 
-dynamo_r = boto3.resource("dynamodb")
-lambda_client = boto3.client("lambda")
+# Keep-alive + pool del tamaño del ThreadPoolExecutor (los workers no hacen cola
+# por conexión). DynamoDB con timeouts cortos, como en assign.
+_POOL_WORKERS = 10
+_DDB_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=_POOL_WORKERS,
+    retries={"max_attempts": 3, "mode": "standard"},
+    connect_timeout=1,
+    read_timeout=3,
+)
+_AWS_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=_POOL_WORKERS,
+    retries={"max_attempts": 3, "mode": "standard"},
+    connect_timeout=1,
+)
+
+dynamo_r = boto3.resource("dynamodb", config=_DDB_CFG)
+lambda_client = boto3.client("lambda", config=_AWS_CFG)
+sqs_client = boto3.client("sqs", config=_AWS_CFG) if IG_SENDER_QUEUE_URL else None
 
 games_table = dynamo_r.Table(GAMES_TABLE)
 gp_table = dynamo_r.Table(GAMEPLAYER_TABLE)
 
+# Escrituras/lecturas por player en paralelo
+_pool = ThreadPoolExecutor(max_workers=_POOL_WORKERS)
+
 HEADERS = {"Content-Type": "application/json"}
 
 
 # ----------------- util -----------------
 
+def _json_default(o):
+    if isinstance(o, Decimal):
+        return int(o) if o % 1 == 0 else float(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+# Encoder único: json.dumps con kwargs construye un JSONEncoder nuevo en cada llamada
+_json_encode = json.JSONEncoder(ensure_ascii=False, default=_json_default).encode
+
+
 def log(msg, obj=None):
     if obj is not None:
-        print(json.dumps({"msg": msg, "data": obj}, ensure_ascii=False))
+        print(_json_encode({"msg": msg, "data": obj}))
     else:
-        print(json.dumps({"msg": msg}, ensure_ascii=False))
-
-
-def _json_sanitize(obj):
-    if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
-    if isinstance(obj, dict):
-        return {k: _json_sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_json_sanitize(v) for v in obj]
-    return obj
+        print(_json_encode({"msg": msg}))
 
 
 def _resp(code, body):
     if not isinstance(body, str):
-        body = json.dumps(_json_sanitize(body), ensure_ascii=False)
+        body = _json_encode(body)
     return {"statusCode": int(code), "body": body, "headers": HEADERS}
 
 
 def _iso_now():
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    return datetime.now(timezone.utc).isoformat()[:-6] + "Z"
 
 
 def _as_int(x):
@@ -75,7 +101,7 @@ def _parse_http_event(event: dict):
     raw = (event or {}).get("body") or ""
     if raw and (event or {}).get("isBase64Encoded"):
         try:
-            raw = base64.b64decode(raw).decode("utf-8")
+            raw = base64.b64decode(raw)  # json.loads acepta bytes (utf-8)
         except Exception as e:
             log("body_b64_decode_error", {"error": repr(e)})
             raw = ""
@@ -94,20 +120,109 @@ def _parse_http_event(event: dict):
 
 # ----------------- IG sender -----------------
 
+# Los DMs de una invocación se acumulan y salen juntos al final del handler
+# (_flush_pending): envíos por lotes en vez de un invoke por mensaje.
+_PENDING: list = []
+
+# Sufijo del payload de quick reply con el playerId del destinatario
+_PID_SEP = "#P"
+
+
 def _invoke_instagram_sender(messages):
     if not messages:
         return
-    if not IG_SENDER_LAMBDA:
-        log("igsender_missing_env", {"count": len(messages)})
-        return
+    _PENDING.extend(messages)
+
+
+_ig_encode = _json_encode  # encoder del bloque compartido de abajo
+
+
+# >>> IG sender FIFO: copia idéntica en stand_prod_game_fn_assign y
+# stand_prod_game_fn_quiz (cada Lambda se despliega por separado, sin código
+# compartido). Cualquier cambio aquí, en las dos copias a la vez.
+
+# Async invoke y SQS cortan en 256 KB: dejamos margen para el envoltorio
+_MAX_PAYLOAD_BYTES = 240_000
+_SQS_BATCH_MAX = 10  # límite de SendMessageBatch
+
+
+def _split_payloads(messages) -> list:
+    # [(messages, body)]: si no cabe en un envío se parte en mitades (en orden)
+    body = _ig_encode({"messages": messages}).encode("utf-8")
+    if len(body) > _MAX_PAYLOAD_BYTES and len(messages) > 1:
+        mid = len(messages) // 2
+        return _split_payloads(messages[:mid]) + _split_payloads(messages[mid:])
+    return [(messages, body)]
+
+
+def _send_sqs_batch(entries):
     try:
-        lambda_client.invoke(
-            FunctionName=IG_SENDER_LAMBDA,
-            InvocationType="Event",
-            Payload=json.dumps({"messages": messages}, ensure_ascii=False).encode("utf-8"),
-        )
+        resp = sqs_client.send_message_batch(QueueUrl=IG_SENDER_QUEUE_URL, Entries=entries)
+        failed = resp.get("Failed") or []
+        if failed:
+            log("igsender_sqs_batch_failed", {"failed": len(failed), "codes": [f.get("Code") for f in failed]})
     except Exception as e:
-        log("igsender_invoke_error", {"error": repr(e), "count": len(messages)})
+        log("igsender_send_error", {"error": repr(e), "count": len(entries)})
+
+
+def _send_to_ig_sender(messages):
+    """
+    Envía {"messages": [...]} a la cola FIFO del IG sender (o invoke Event si no
+    hay cola). En la cola cada psid va con su MessageGroupId: SQS solo garantiza
+    el orden dentro de un grupo, así que los mensajes se agrupan por psid.
+    """
+    if not messages:
+        return
+
+    if not sqs_client:
+        for chunk, body in _split_payloads(messages):
+            try:
+                lambda_client.invoke(
+                    FunctionName=IG_SENDER_LAMBDA,
+                    InvocationType="Event",
+                    Payload=body,
+                )
+            except Exception as e:
+                log("igsender_send_error", {"error": repr(e), "count": len(chunk)})
+        return
+
+    groups: dict[str, list] = {}
+    for m in messages:
+        groups.setdefault(str(m.get("psid") or "-"), []).append(m)
+
+    batch, size = [], 0
+    for psid, group in groups.items():
+        for _, body in _split_payloads(group):
+            if batch and (len(batch) == _SQS_BATCH_MAX or size + len(body) > _MAX_PAYLOAD_BYTES):
+                _send_sqs_batch(batch)
+                batch, size = [], 0
+            batch.append({
+                "Id": str(len(batch)),
+                "MessageBody": body.decode("utf-8"),
+                "MessageGroupId": psid,
+                "MessageDeduplicationId": uuid.uuid4().hex,
+            })
+            size += len(body)
+    if batch:
+        _send_sqs_batch(batch)
+# <<< IG sender FIFO
+
+
+def _send_messages_now(messages):
+    if not messages:
+        return
+    if not IG_SENDER_QUEUE_URL and not IG_SENDER_LAMBDA:
+        log("igsender_missing_env", {"count": len(messages)})
+        return
+    _send_to_ig_sender(messages)
+
+
+def _flush_pending():
+    if not _PENDING:
+        return
+    messages = _PENDING[:]
+    _PENDING.clear()
+    _send_messages_now(messages)
 
 
 def _send_dm(psid: str, text: str) -> bool:
@@ -117,7 +232,18 @@ def _send_dm(psid: str, text: str) -> bool:
     return True
 
 
-def _send_quiz_question(psid: str, question_id: str, questions_cfg: dict) -> bool:
+# (gameId, questionId) -> (questions_cfg, text, quick_replies) ya normalizado.
+# Válido solo mientras questions_cfg sea el mismo objeto (el de la caché de meta).
+_QUESTION_TEMPLATES: dict[tuple, tuple] = {}
+_QUESTION_TEMPLATES_MAX = 256
+
+
+def _question_template(game_id: str, question_id: str, questions_cfg: dict):
+    key = (game_id, question_id)
+    hit = _QUESTION_TEMPLATES.get(key)
+    if hit and hit[0] is questions_cfg:
+        return hit[1], hit[2]
+
     q = questions_cfg.get(question_id) or {}
     text = (q.get("text") or "").strip()
     options = q.get("options", []) or []
@@ -128,12 +254,36 @@ def _send_quiz_question(psid: str, question_id: str, questions_cfg: dict) -> boo
         payload = (opt.get("payload") or "").strip()
         if not title or not payload:
             continue
-        quick_replies.append({"content_type": "text", "title": title, "payload": payload})
+        quick_replies.append((title, payload))
+    quick_replies = tuple(quick_replies)
+
+    if len(_QUESTION_TEMPLATES) >= _QUESTION_TEMPLATES_MAX:
+        _QUESTION_TEMPLATES.clear()
+    _QUESTION_TEMPLATES[key] = (questions_cfg, text, quick_replies)
+    return text, quick_replies
+
+
+def _build_quiz_question_message(psid: str, question_id: str, questions_cfg: dict, player_id=None,
+                                 game_id: str = "") -> dict:
+    text, options = _question_template(game_id, question_id, questions_cfg)
 
-    if not quick_replies:
-        return _send_dm(psid, text)
+    if not options:
+        return {"psid": psid, "text": text}
 
-    _invoke_instagram_sender([{"psid": psid, "text": text, "quick_replies": quick_replies}])
+    # el answer trae el playerId -> get_item directo en vez de query al GSI
+    suffix = f"{_PID_SEP}{player_id}" if player_id is not None else ""
+    quick_replies = [
+        {"content_type": "text", "title": title, "payload": payload + suffix}
+        for title, payload in options
+    ]
+    return {"psid": psid, "text": text, "quick_replies": quick_replies}
+
+
+def _send_quiz_question(psid: str, question_id: str, questions_cfg: dict, player_id=None,
+                        game_id: str = "") -> bool:
+    if not psid or psid == "#":
+        return False
+    _invoke_instagram_sender([_build_quiz_question_message(psid, question_id, questions_cfg, player_id, game_id)])
     return True
 
 
@@ -175,15 +325,44 @@ def _save_quiz_meta(game_id: str, questions: list[dict]):
         UpdateExpression="SET quizOrder = :o, quizQuestions = :q",
         ExpressionAttributeValues={":o": quiz_order, ":q": quiz_questions},
     )
+    _QUIZ_META_CACHE.pop(game_id, None)
     log("quiz_meta_saved", {"gameId": game_id, "quizOrder": quiz_order})
 
 
+# Cache warm de la config del quiz (cambia muy poco; POST configure la invalida)
+_QUIZ_META_CACHE: dict[str, tuple[float, tuple, dict]] = {}
+_QUIZ_META_TTL_S = 60.0
+
+
 def _get_quiz_meta(game_id: str):
+    """
+    -> (quizOrder, quizQuestions, item) o ([], {}, None).
+    Compartido con la caché: NO mutar.
+    """
+    hit = _QUIZ_META_CACHE.get(game_id)
+    if hit and time.monotonic() - hit[0] < _QUIZ_META_TTL_S:
+        return hit[1]
+
     resp = games_table.get_item(Key={"gameId": game_id})
     item = resp.get("Item")
     if not item:
+        # no cacheamos "no existe": puede crearse justo después
         return [], {}, None
-    return item.get("quizOrder", []) or [], item.get("quizQuestions", {}) or {}, item
+    meta = (item.get("quizOrder", []) or [], item.get("quizQuestions", {}) or {}, item)
+    _QUIZ_META_CACHE[game_id] = (time.monotonic(), meta, _build_qid_index(meta[0]))
+    return meta
+
+
+def _build_qid_index(quiz_order) -> dict:
+    return {qid: i for i, qid in enumerate(quiz_order)}
+
+
+def _get_qid_index(game_id: str, quiz_order) -> dict:
+    """qid -> posición en quizOrder; sale de la caché si ese quizOrder está cacheado."""
+    hit = _QUIZ_META_CACHE.get(game_id)
+    if hit and hit[1][0] is quiz_order:
+        return hit[2]
+    return _build_qid_index(quiz_order)
 
 
 def _prepare_quiz_for_existing_players(game_id: str, game_type_upper: str):
@@ -193,11 +372,14 @@ def _prepare_quiz_for_existing_players(game_id: str, game_type_upper: str):
     gk = game_type_upper.upper()
     now = _iso_now()
 
-    # Query todos los players del game (PK=gameId)
+    # Query todos los players del game (PK=gameId); solo hace falta la key
     items = []
     last = None
     while True:
-        kwargs = {"KeyConditionExpression": Key("gameId").eq(game_id)}
+        kwargs = {
+            "KeyConditionExpression": Key("gameId").eq(game_id),
+            "ProjectionExpression": "playerId",
+        }
         if last:
             kwargs["ExclusiveStartKey"] = last
         resp = gp_table.query(**kwargs)
@@ -206,51 +388,91 @@ def _prepare_quiz_for_existing_players(game_id: str, game_type_upper: str):
         if not last:
             break
 
-    updated = 0
+    pids = []
     for it in items:
         pid = _as_int(it.get("playerId"))
         if pid is None or pid <= 0:
             continue
+        pids.append(pid)
 
-        # asegura type
-        gp_table.update_item(
-            Key={"gameId": game_id, "playerId": int(pid)},
-            UpdateExpression="SET #type = if_not_exists(#type, :tinit)",
-            ExpressionAttributeNames={"#type": "type"},
-            ExpressionAttributeValues={":tinit": {}},
-        )
+    # un update por player, en paralelo (cliente de boto3 thread-safe)
+    updated = sum(_pool.map(lambda pid: _prepare_player_quiz(game_id, pid, gk, now), pids))
 
-        # asegura type.<gk>
-        gp_table.update_item(
-            Key={"gameId": game_id, "playerId": int(pid)},
-            UpdateExpression="SET #type.#g = if_not_exists(#type.#g, :ginit)",
-            ExpressionAttributeNames={"#type": "type", "#g": gk},
-            ExpressionAttributeValues={":ginit": {}},
-        )
+    return {"playersSeen": len(items), "playersUpdated": updated}
+
+
+def _prepare_player_quiz(game_id: str, pid: int, gk: str, now: str) -> int:
+    key = {"gameId": game_id, "playerId": int(pid)}
+    defaults = {
+        ":req": True,
+        ":done": False,
+        ":cur": None,
+        ":qainit": {},
+        ":t": now,
+    }
+    prepared_values = {**defaults, ":nulltype": "NULL"}
+    defaults_expr = (
+        "SET #type.#g.quizRequired = :req, "
+        "#type.#g.quizCompleted = :done, "
+        "#type.#g.quizCurrentQuestion = :cur, "
+        "#type.#g.#qa = if_not_exists(#type.#g.#qa, :qainit), "
+        "#type.#g.quizUpdatedAt = :t"
+    )
+    names = {"#type": "type", "#g": gk, "#qa": "quizAnswers"}
 
-        # defaults quiz
+    # Camino normal: type.<gk> ya existe (lo crea assign) -> una sola escritura.
+    # DynamoDB no deja crear #type y #type.#g en la misma expresión (paths solapados).
+    # Si el player ya tiene exactamente estos defaults (re-POST de la config), la
+    # escritura no cambiaría nada salvo quizUpdatedAt: el condition la evita.
+    try:
         gp_table.update_item(
-            Key={"gameId": game_id, "playerId": int(pid)},
-            UpdateExpression=(
-                "SET #type.#g.quizRequired = :req, "
-                "#type.#g.quizCompleted = :done, "
-                "#type.#g.quizCurrentQuestion = :cur, "
-                "#type.#g.#qa = if_not_exists(#type.#g.#qa, :qainit), "
-                "#type.#g.quizUpdatedAt = :t"
+            Key=key,
+            UpdateExpression=defaults_expr,
+            ConditionExpression=(
+                "attribute_exists(#type.#g) AND NOT ("
+                "#type.#g.quizRequired = :req AND "
+                "#type.#g.quizCompleted = :done AND "
+                "attribute_type(#type.#g.quizCurrentQuestion, :nulltype) AND "
+                "attribute_exists(#type.#g.#qa))"
             ),
-            ExpressionAttributeNames={"#type": "type", "#g": gk, "#qa": "quizAnswers"},
-            ExpressionAttributeValues={
-                ":req": True,
-                ":done": False,
-                ":cur": None,
-                ":qainit": {},
-                ":t": now,
-            },
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=prepared_values,
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
         )
+        return 1
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code not in ("ConditionalCheckFailedException", "ValidationException"):
+            raise
+        # item viene en formato low-level: si type.<gk> existe, ya estaba preparado
+        old_type = ((e.response.get("Item") or {}).get("type") or {}).get("M") or {}
+        if code == "ConditionalCheckFailedException" and gk in old_type:
+            return 0
+
+    # asegura type
+    gp_table.update_item(
+        Key=key,
+        UpdateExpression="SET #type = if_not_exists(#type, :tinit)",
+        ExpressionAttributeNames={"#type": "type"},
+        ExpressionAttributeValues={":tinit": {}},
+    )
 
-        updated += 1
+    # asegura type.<gk>
+    gp_table.update_item(
+        Key=key,
+        UpdateExpression="SET #type.#g = if_not_exists(#type.#g, :ginit)",
+        ExpressionAttributeNames={"#type": "type", "#g": gk},
+        ExpressionAttributeValues={":ginit": {}},
+    )
 
-    return {"playersSeen": len(items), "playersUpdated": updated}
+    # defaults quiz
+    gp_table.update_item(
+        Key=key,
+        UpdateExpression=defaults_expr,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=defaults,
+    )
+    return 1
 
 
 # ----------------- Player access (GSI gsi-instagramPSID) -----------------
@@ -269,11 +491,46 @@ def _get_player_by_psid_and_game(psid: str, game_id: str):
     return items[0] if items else None
 
 
-def _scan_players_in_game(game_id: str):
+def _get_player_by_key(game_id: str, player_id: int, psid: str):
+    """
+    get_item por PK cuando el payload trae el playerId. Solo vale si el player
+    es de ese psid (el payload viene del cliente); si no, None -> GSI.
+    """
+    resp = gp_table.get_item(
+        Key={"gameId": game_id, "playerId": int(player_id)},
+        ProjectionExpression="playerId, instagramPSID, validationCode",
+    )
+    item = resp.get("Item")
+    if not item or item.get("instagramPSID") != psid:
+        return None
+    return item
+
+
+def _export_projection(game_type_upper: str | None):
+    # solo los campos que devuelve el export (+ type.<g> si hay quiz)
+    projection = "playerId, instagramPSID, instagramUsername"
+    names = None
+    if game_type_upper:
+        projection += ", #type.#g"
+        names = {"#type": "type", "#g": game_type_upper}
+    return projection, names
+
+
+def _scan_players_in_game(game_id: str, game_type_upper: str | None = None):
+    """
+    Players del game para el export: solo los campos que se devuelven
+    (+ type.<g> si hay quiz).
+    """
     out = []
     last = None
+    projection, names = _export_projection(game_type_upper)
     while True:
-        kwargs = {"KeyConditionExpression": Key("gameId").eq(game_id)}
+        kwargs = {
+            "KeyConditionExpression": Key("gameId").eq(game_id),
+            "ProjectionExpression": projection,
+        }
+        if names:
+            kwargs["ExpressionAttributeNames"] = names
         if last:
             kwargs["ExclusiveStartKey"] = last
         resp = gp_table.query(**kwargs)
@@ -284,6 +541,82 @@ def _scan_players_in_game(game_id: str):
     return out
 
 
+_BATCH_GET_MAX_KEYS = 100  # límite de BatchGetItem
+_BATCH_GET_MAX_ATTEMPTS = 5
+_BATCH_GET_BACKOFF_S = 0.05
+
+
+class _BatchGetIncomplete(Exception):
+    """UnprocessedKeys que siguen pendientes tras agotar los reintentos."""
+
+
+def _batch_get_chunk(game_id: str, player_ids: list, projection: str, names):
+    request = {
+        "Keys": [{"gameId": game_id, "playerId": pid} for pid in player_ids],
+        "ProjectionExpression": projection,
+    }
+    if names:
+        request["ExpressionAttributeNames"] = names
+
+    out = []
+    pending = {GAMEPLAYER_TABLE: request}
+    for attempt in range(_BATCH_GET_MAX_ATTEMPTS):
+        if attempt:
+            # backoff exponencial con jitter (50ms, 100ms, 200ms...)
+            time.sleep(_BATCH_GET_BACKOFF_S * (2 ** (attempt - 1)) * (0.5 + random.random()))
+        resp = dynamo_r.batch_get_item(RequestItems=pending)
+        out.extend((resp.get("Responses") or {}).get(GAMEPLAYER_TABLE) or [])
+        # UnprocessedKeys (throttling): se reintentan con el mismo projection
+        pending = resp.get("UnprocessedKeys") or None
+        if not pending:
+            return out
+
+    left = len((pending.get(GAMEPLAYER_TABLE) or {}).get("Keys") or [])
+    log("quiz_export_batch_get_incomplete", {"gameId": game_id, "unprocessed": left, "attempts": _BATCH_GET_MAX_ATTEMPTS})
+    raise _BatchGetIncomplete(f"{left} keys unprocessed")
+
+
+def _batch_get_players(game_id: str, player_ids: list, game_type_upper: str | None = None):
+    """
+    Export filtrado por ?playerIds=1,2,3: BatchGetItem de 100 en 100 (en
+    paralelo) en vez de leer toda la partición. Orden por playerId, como la query.
+    """
+    projection, names = _export_projection(game_type_upper)
+    chunks = [
+        player_ids[i:i + _BATCH_GET_MAX_KEYS]
+        for i in range(0, len(player_ids), _BATCH_GET_MAX_KEYS)
+    ]
+    out = []
+    for items in _pool.map(lambda c: _batch_get_chunk(game_id, c, projection, names), chunks):
+        out.extend(items)
+    out.sort(key=lambda it: _as_int(it.get("playerId")) or 0)
+    return out
+
+
+def _parse_player_ids(raw) -> list | None:
+    # "1,2,3" -> [1, 2, 3] (sin duplicados); None si no viene el filtro
+    if not raw:
+        return None
+    pids = []
+    seen = set()
+    for part in str(raw).split(","):
+        pid = _as_int(part.strip())
+        if pid is None or pid <= 0 or pid in seen:
+            continue
+        seen.add(pid)
+        pids.append(pid)
+    return pids
+
+
+def _export_players(game_id: str, qs: dict, game_type_upper: str | None = None):
+    player_ids = _parse_player_ids(qs.get("playerIds"))
+    if player_ids is None:
+        return _scan_players_in_game(game_id, game_type_upper)
+    if not player_ids:
+        return []
+    return _batch_get_players(game_id, player_ids, game_type_upper)
+
+
 # ----------------- Quiz state en type.<GAME_TYPE_UPPER> -----------------
 
 def _get_type_blob(player_item: dict, game_type_upper: str) -> dict:
@@ -314,7 +647,12 @@ def _set_quiz_state(game_id: str, player_id: int, game_type_upper: str, next_que
     return now
 
 
-def _save_quiz_answer(game_id: str, player_id: int, game_type_upper: str, question_id: str, answer_id: str):
+def _record_quiz_answer(game_id: str, player_id: int, game_type_upper: str, question_id: str,
+                        answer_id: str, next_question_id, completed: bool):
+    """
+    Guarda la respuesta y avanza el estado del quiz en una sola escritura:
+    SET type.<g>.quizAnswers.<qid>, quizCurrentQuestion, quizCompleted, quizUpdatedAt
+    """
     gk = (game_type_upper or "").upper()
     if not gk:
         raise ValueError("Missing gameType")
@@ -323,29 +661,52 @@ def _save_quiz_answer(game_id: str, player_id: int, game_type_upper: str, questi
 
     gp_table.update_item(
         Key={"gameId": game_id, "playerId": int(player_id)},
-        UpdateExpression="SET #type.#g.#qa.#qid = :ans, #type.#g.quizUpdatedAt = :t",
+        UpdateExpression=(
+            "SET #type.#g.#qa.#qid = :ans, "
+            "#type.#g.quizCurrentQuestion = :next, "
+            "#type.#g.quizCompleted = :done, "
+            "#type.#g.quizUpdatedAt = :t"
+        ),
         ExpressionAttributeNames={
             "#type": "type",
             "#g": gk,
             "#qa": "quizAnswers",
             "#qid": str(question_id),
         },
-        ExpressionAttributeValues={":ans": str(answer_id), ":t": now},
+        ExpressionAttributeValues={
+            ":ans": str(answer_id),
+            ":next": next_question_id,
+            ":done": bool(completed),
+            ":t": now,
+        },
     )
     return now
 
 
-def _next_question_id(current_qid: str, quiz_order: list[str]):
+def _next_question_id(current_qid: str, quiz_order: list[str], qid_index: dict | None = None):
     if not quiz_order:
         return None
-    if current_qid not in quiz_order:
+    if qid_index is None:
+        qid_index = _build_qid_index(quiz_order)
+    idx = qid_index.get(current_qid)
+    if idx is None:
         return quiz_order[0]
-    idx = quiz_order.index(current_qid)
     return quiz_order[idx + 1] if idx + 1 < len(quiz_order) else None
 
 
 # ----------------- Payload parsing -----------------
 
+def _split_player_id(payload: str):
+    """
+    "{gameId}_{questionId}_{answerId}#P{playerId}" -> (payload sin sufijo, playerId)
+    Payloads antiguos (sin sufijo) -> (payload, None)
+    """
+    base, sep, pid = payload.rpartition(_PID_SEP)
+    if not sep or not pid.isdigit():
+        return payload, None
+    return base, int(pid)
+
+
 def _parse_quiz_payload(payload: str):
     """
     Esperado: "{gameId}_{questionId}_{answerId}"
@@ -372,6 +733,14 @@ def _parse_quiz_payload(payload: str):
 # ----------------- MAIN handler -----------------
 
 def lambda_handler(event, context):
+    try:
+        return _handle_event(event)
+    finally:
+        # DMs acumulados durante la invocación (también si ha habido error)
+        _flush_pending()
+
+
+def _handle_event(event):
     # ========== HTTP MODE ==========
     if isinstance(event, dict) and ("httpMethod" in event or "requestContext" in event):
         method, body, qs = _parse_http_event(event)
@@ -394,7 +763,10 @@ def lambda_handler(event, context):
 
             # 👇 CLAVE: si no hay quiz configurado -> 200 OK con listas vacías
             if not quiz_order:
-                players_items = _scan_players_in_game(game_id)
+                try:
+                    players_items = _export_players(game_id, qs)
+                except _BatchGetIncomplete:
+                    return _resp(503, {"ok": False, "error": "Throttled"})
                 players_out = []
                 for it in players_items:
                     pid = _as_int(it.get("playerId"))
@@ -435,7 +807,10 @@ def lambda_handler(event, context):
                 questions_out.append({"id": qid, "text": qcfg.get("text"), "options": opts_out})
 
             # Players export
-            players_items = _scan_players_in_game(game_id)
+            try:
+                players_items = _export_players(game_id, qs, gk)
+            except _BatchGetIncomplete:
+                return _resp(503, {"ok": False, "error": "Throttled"})
             players_out = []
             for it in players_items:
                 pid = _as_int(it.get("playerId"))
@@ -508,42 +883,76 @@ def lambda_handler(event, context):
                 log("bad_quiz_start_event", event)
                 return {"ok": False, "error": "missing_gameId_or_psids"}
 
+            # preMessages: welcome & co del assign; van delante del quiz de
+            # cada psid en el mismo envío para que lleguen antes que la pregunta
+            pre_by_psid = {}
+            for m in event.get("preMessages") or []:
+                if isinstance(m, dict) and m.get("psid"):
+                    pre_by_psid.setdefault(m["psid"], []).append(m)
+            # noQuizMessages: el código de validación, por si aquí ya no hay quiz
+            # (config cambiada o caché del assign desfasada) -> nunca se pierde
+            no_quiz_by_psid = {}
+            for m in event.get("noQuizMessages") or []:
+                if isinstance(m, dict) and m.get("psid"):
+                    no_quiz_by_psid.setdefault(m["psid"], []).append(m)
+
             quiz_order, quiz_questions, meta = _get_quiz_meta(game_id)
             if not meta:
                 for p in psids:
+                    _invoke_instagram_sender(pre_by_psid.get(p) or [])
                     _send_dm(p, "Esa partida no existe. 🙈")
+                    _invoke_instagram_sender(no_quiz_by_psid.get(p) or [])
                 return {"ok": False, "error": "game_not_found"}
 
             if not quiz_order:
                 # IMPORTANT: do NOT send intro text here (no quiz)
+                for p in psids:
+                    _invoke_instagram_sender(pre_by_psid.get(p) or [])
+                    _invoke_instagram_sender(no_quiz_by_psid.get(p) or [])
                 return {"ok": False, "error": "no_quiz_config"}
 
             game_type = (meta.get("gameType") or "").upper()
             first_qid = quiz_order[0]
+            def _start_one(psid):
+                """-> (result, messages) de un psid; nunca lanza para no frenar al resto."""
+                try:
+                    player = _get_player_by_psid_and_game(psid, game_id)
+                    if not player:
+                        return (
+                            {"psid": psid, "started": False, "reason": "player_not_found"},
+                            [{"psid": psid, "text": "No he encontrado tu participación en la partida. ¿Has usado el código correcto?"}],
+                        )
+
+                    pid = _as_int(player.get("playerId"))
+                    if pid is None:
+                        return {"psid": psid, "started": False, "reason": "bad_playerId"}, []
+
+                    _set_quiz_state(game_id, pid, game_type, first_qid, completed=False)
+                except Exception as e:
+                    log("quiz_start_player_error", {"psid": psid, "error": repr(e)})
+                    return {"psid": psid, "started": False, "reason": "error"}, []
+
+                # intro y pregunta van juntas y en orden (ya no hace falta el sleep)
+                return (
+                    {"psid": psid, "started": True, "playerId": pid, "firstQuestion": first_qid},
+                    [
+                        {"psid": psid, "text": QUIZ_INTRO_TEXT},
+                        _build_quiz_question_message(psid, first_qid, quiz_questions, pid, game_id),
+                    ],
+                )
+
+            # lookup GSI + update por psid en paralelo; map conserva el orden de psids
             results = []
-
-            for psid in psids:
-                player = _get_player_by_psid_and_game(psid, game_id)
-                if not player:
-                    _send_dm(psid, "No he encontrado tu participación en la partida. ¿Has usado el código correcto?")
-                    results.append({"psid": psid, "started": False, "reason": "player_not_found"})
-                    continue
-
-                pid = _as_int(player.get("playerId"))
-                if pid is None:
-                    results.append({"psid": psid, "started": False, "reason": "bad_playerId"})
-                    continue
-                
-                _send_dm(psid, QUIZ_INTRO_TEXT)
-
-                time.sleep(1)
-
-                _set_quiz_state(game_id, pid, game_type, first_qid, completed=False)
-
-                _send_quiz_question(psid, first_qid, quiz_questions)
-
-                results.append({"psid": psid, "started": True, "playerId": pid, "firstQuestion": first_qid})
-
+            # intro + primera pregunta de todos los psids en un solo envío
+            all_messages = []
+            for psid, (result, messages) in zip(psids, _pool.map(_start_one, psids)):
+                results.append(result)
+                all_messages.extend(pre_by_psid.pop(psid, None) or [])
+                all_messages.extend(messages)
+            for rest in pre_by_psid.values():
+                all_messages.extend(rest)
+
+            _invoke_instagram_sender(all_messages)
             return {"ok": True, "gameId": game_id, "results": results}
 
 
@@ -559,6 +968,7 @@ def lambda_handler(event, context):
             log("bad_quiz_event", event)
             return {"ok": False, "error": "missing_psid_or_payload"}
 
+        quiz_payload, payload_pid = _split_player_id(quiz_payload)
         game_id, question_id, answer_id = _parse_quiz_payload(quiz_payload)
 
         # controles QR_*
@@ -580,7 +990,11 @@ def lambda_handler(event, context):
         if not quiz_order:
             return {"ok": False, "error": "no_quiz_config"}
 
-        player = _get_player_by_psid_and_game(psid, game_id)
+        player = None
+        if payload_pid is not None:
+            player = _get_player_by_key(game_id, payload_pid, psid)
+        if not player:
+            player = _get_player_by_psid_and_game(psid, game_id)
         if not player:
             return {"ok": False, "error": "player_not_found"}
 
@@ -588,14 +1002,11 @@ def lambda_handler(event, context):
         if pid is None:
             return {"ok": False, "error": "bad_playerId"}
 
-        _save_quiz_answer(game_id, pid, game_type, question_id, answer_id)
-
-        next_qid = _next_question_id(question_id, quiz_order)
+        next_qid = _next_question_id(question_id, quiz_order, _get_qid_index(game_id, quiz_order))
+        _record_quiz_answer(game_id, pid, game_type, question_id, answer_id, next_qid, completed=not next_qid)
 
         code = player.get("validationCode")
         if not next_qid:
-            _set_quiz_state(game_id, pid, game_type, None, completed=True)
-
             if code:
                 _send_dm(psid, f"🎟️ Tu código para jugar es: {code}\n\nVe a la pantalla, introdúcelo y ¡a jugar! 🚀")
             else:
@@ -603,8 +1014,7 @@ def lambda_handler(event, context):
 
             return {"ok": True, "completed": True, "gameId": game_id, "playerId": pid}
 
-        _set_quiz_state(game_id, pid, game_type, next_qid, completed=False)
-        _send_quiz_question(psid, next_qid, quiz_questions)
+        _send_quiz_question(psid, next_qid, quiz_questions, pid, game_id)
         return {"ok": True, "nextQuestion": next_qid, "gameId": game_id, "playerId": pid}
 
     except ClientError as e:
@@ -5,7 +5,7 @@ from boto3.dynamodb.conditions import Key
 
 
 def _iso_now() -> str:
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    return datetime.now(timezone.utc).isoformat()[:-6] + "Z"
 
 
 def _as_int(x):
@@ -109,8 +109,10 @@ def store_score(game_id: str, game_type_upper: str, gp_table, payload: dict, log
     if not item:
         return {"ok": False, "error": "player_not_found", "message": "No existe ningún jugador con ese playerId."}
 
-    # 2) asegurar mapas type.<GAME>
-    _ensure_type_maps(game_id, player_id, gk, gp_table)
+    # 2) asegurar mapas type.<GAME> (solo si faltan: el assigner ya los crea,
+    #    así que normalmente nos ahorramos los 2 updates)
+    if not isinstance((item.get("type") or {}).get(gk), dict):
+        _ensure_type_maps(game_id, player_id, gk, gp_table)
 
     # 3) escribir score/timer
     now = _iso_now()
@@ -20,24 +20,20 @@ gp_table = dynamo_r.Table(GAMEPLAYER_TABLE)
 
 def log(msg, obj=None):
     if obj is not None:
-        print(json.dumps({"msg": msg, "data": _json_sanitize(obj)}, ensure_ascii=False))
+        print(json.dumps({"msg": msg, "data": obj}, ensure_ascii=False, default=_json_default))
     else:
         print(json.dumps({"msg": msg}, ensure_ascii=False))
 
 
-def _json_sanitize(obj):
-    if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
-    if isinstance(obj, dict):
-        return {k: _json_sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_json_sanitize(v) for v in obj]
-    return obj
+def _json_default(o):
+    if isinstance(o, Decimal):
+        return int(o) if o % 1 == 0 else float(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
 
 
 def _resp(status, body):
     if not isinstance(body, str):
-        body = json.dumps(_json_sanitize(body), ensure_ascii=False)
+        body = json.dumps(body, ensure_ascii=False, default=_json_default)
     return {
         "statusCode": int(status),
         "headers": {"Content-Type": "application/json"},
@@ -2,7 +2,7 @@ from decimal import Decimal
 from datetime import datetime, timezone
 
 def _iso_now():
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    return datetime.now(timezone.utc).isoformat()[:-6] + "Z"
 
 def validate_single_code_t1mer(ctx: dict):
     return _validate_single_code(ctx, game_label="T1mer")
@@ -9,6 +9,10 @@ import boto3
 IG_GRAPH_VERSION = os.environ.get("IG_GRAPH_VERSION", "v24.0")
 IG_TIMEOUT       = int(os.environ.get("IG_TIMEOUT_SECONDS", "8"))
 
+# Margen (ms) sobre el peor caso de un record (mensajes * IG_TIMEOUT) antes de
+# empezarlo: si no da tiempo se devuelve sin enviar en vez de cortar a medias
+_SQS_TIME_MARGIN_MS = 2000
+
 # Instagram keys solo desde Secrets Manager (INSTAGRAM_SECRET_NAME obligatorio)
 # Secret: PAGE_TOKEN, VERIFY_TOKEN, SENDER_ID
 IG_PAGE_TOKEN = ""
@@ -150,6 +154,117 @@ def _send_single_message(psid: str, text: str = None, quick_replies=None, image_
     return {"ok": True, "status": status}
 
 
+def _send_messages(messages: list):
+    """Envía en orden. -> (results, success, failed)"""
+    results = []
+    success = 0
+    failed = 0
+
+    for msg in messages:
+        if not isinstance(msg, dict):
+            failed += 1
+            results.append({"ok": False, "reason": "message_not_object"})
+            continue
+
+        psid = msg.get("psid")
+        text = msg.get("text")
+        quick_replies = msg.get("quick_replies")
+        image_url = msg.get("image_url")
+
+        # Permitimos text O image_url (al menos uno)
+        if not psid or (not text and not image_url):
+            log("skip_invalid_message", {"message": msg})
+            failed += 1
+            results.append({"psid": psid, "ok": False, "reason": "missing_psid_or_content"})
+            continue
+
+        r = _send_single_message(psid, text=text, quick_replies=quick_replies, image_url=image_url)
+        if r.get("ok"):
+            success += 1
+        else:
+            failed += 1
+        results.append({"psid": psid, **r})
+
+    return results, success, failed
+
+
+def _is_retryable(result: dict) -> bool:
+    # sin status (red/timeout/config), throttling o 5xx de Graph
+    status = result.get("status")
+    return result.get("error") == "send_failed" and (status is None or status == 429 or status >= 500)
+
+
+def _handle_sqs(records, context=None) -> dict:
+    """
+    Cada record de SQS lleva en el body el mismo payload que la invocación
+    interna ({"messages": [...]}). Se procesan en orden (welcome antes que quiz)
+    y se devuelve batchItemFailures (ReportBatchItemFailures) para que SQS
+    reintente solo esos records.
+
+    Un record solo se reintenta si NO se llegó a enviar ninguno de sus mensajes
+    y algún fallo es transitorio: reintentar uno a medias duplicaría DMs.
+
+    Cola FIFO: si un record de un MessageGroupId (psid) falla, los siguientes
+    del mismo grupo no se envían y se devuelven también como fallidos, para
+    que el reintento mantenga el orden.
+
+    Si no queda tiempo para el peor caso de un record, ese y los siguientes se
+    devuelven sin enviar: un timeout a mitad de lote haría que SQS reentregara
+    el lote entero y se duplicarían los DMs ya enviados.
+    """
+    failures = []
+    failed_groups = set()
+    total = success = failed = 0
+    started = 0
+    out_of_time = False
+
+    for rec in records:
+        mid = (rec or {}).get("messageId")
+        group = ((rec or {}).get("attributes") or {}).get("MessageGroupId")
+        if out_of_time or (group and group in failed_groups):
+            failures.append({"itemIdentifier": mid})
+            continue
+        try:
+            body = json.loads((rec or {}).get("body") or "{}")
+        except Exception:
+            log("invalid_sqs_record_body", {"messageId": mid})
+            continue
+        batch = (body or {}).get("messages")
+        if not isinstance(batch, list):
+            log("invalid_messages_payload", {"messageId": mid, "type": str(type(batch))})
+            continue
+
+        # el primer record va siempre (el Timeout de la función cubre su peor caso)
+        if started and context is not None:
+            need_ms = len(batch) * IG_TIMEOUT * 1000 + _SQS_TIME_MARGIN_MS
+            if context.get_remaining_time_in_millis() < need_ms:
+                log("sqs_out_of_time", {"messageId": mid, "processed": started})
+                out_of_time = True
+                failures.append({"itemIdentifier": mid})
+                continue
+        started += 1
+
+        try:
+            results, ok_n, ko_n = _send_messages(batch)
+        except Exception as e:
+            log("instagram_sender_record_error", {"messageId": mid, "error": repr(e)})
+            failures.append({"itemIdentifier": mid})
+            if group:
+                failed_groups.add(group)
+            continue
+
+        total += len(batch)
+        success += ok_n
+        failed += ko_n
+        if ok_n == 0 and any(not r.get("ok") and _is_retryable(r) for r in results):
+            failures.append({"itemIdentifier": mid})
+            if group:
+                failed_groups.add(group)
+
+    log("dm_send_done", {"total": total, "success": success, "failed": failed, "retry": len(failures)})
+    return {"batchItemFailures": failures}
+
+
 def lambda_handler(event, context):
     """
     Invocación interna:
@@ -160,43 +275,21 @@ def lambda_handler(event, context):
         { "psid": "789", "image_url": "https://..." }
       ]
     }
+
+    O vía SQS (IG_SENDER_QUEUE_URL): {"Records": [{"body": "<payload anterior>"}, ...]}
     """
+    body = event or {}
+    if "Records" in body:
+        return _handle_sqs(body.get("Records") or [], context)
+
     try:
-        body = event or {}
         messages = body.get("messages", [])
 
         if not isinstance(messages, list):
             log("invalid_messages_payload", {"type": str(type(messages))})
             return {"ok": False, "error": "InvalidMessagesPayload", "total": 0, "success": 0, "failed": 0, "results": []}
 
-        results = []
-        success = 0
-        failed = 0
-
-        for msg in messages:
-            if not isinstance(msg, dict):
-                failed += 1
-                results.append({"ok": False, "reason": "message_not_object"})
-                continue
-
-            psid = msg.get("psid")
-            text = msg.get("text")
-            quick_replies = msg.get("quick_replies")
-            image_url = msg.get("image_url")
-
-            # Permitimos text O image_url (al menos uno)
-            if not psid or (not text and not image_url):
-                log("skip_invalid_message", {"message": msg})
-                failed += 1
-                results.append({"psid": psid, "ok": False, "reason": "missing_psid_or_content"})
-                continue
-
-            r = _send_single_message(psid, text=text, quick_replies=quick_replies, image_url=image_url)
-            if r.get("ok"):
-                success += 1
-            else:
-                failed += 1
-            results.append({"psid": psid, **r})
+        results, success, failed = _send_messages(messages)
 
         log("dm_send_done", {"total": len(messages), "success": success, "failed": failed})
         return {"ok": True, "total": len(messages), "success": success, "failed": failed, "results": results}
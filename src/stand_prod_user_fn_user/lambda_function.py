@@ -23,12 +23,15 @@ def _resp(status: int, body):
     }
 
 def _iso_now() -> str:
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()[:-6] + "Z"
 
 def _get_http_method(event: dict) -> str:
-    method = event.get("requestContext", {}).get("http", {}).get("method")
-    if method:
-        return method.upper()
+    # HTTP API (payload v2) primero: es lo que nos llega vía GameApi
+    http = (event.get("requestContext") or {}).get("http")
+    if http:
+        method = http.get("method")
+        if method:
+            return method.upper()
     return (event.get("httpMethod") or "").upper()
 
 def _get_claims(event: dict) -> dict:
@@ -38,7 +41,7 @@ def _get_claims(event: dict) -> dict:
     return jwt.get("claims") or auth.get("claims") or {}
 
 def _parse_iso(s: str):
-    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return datetime.fromisoformat(s)
 
 def _is_expired(active_until: str | None) -> bool:
     if not active_until: